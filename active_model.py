@@ -0,0 +1,131 @@
+"""Keeps every worker process on the same active LLM via a versioned DB row."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from config_loader import LLMConfig
+from llm.base import LLMAdapter
+from llm.service import LLMService
+from models import ActiveModel, db
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_MODEL_ROW_ID = 1
+
+AdapterBuilder = Callable[[str, str, str], LLMAdapter]
+
+
+def publish_active_model(provider: str, model_name: str, embedding_model: str) -> ActiveModel:
+    """Store the new active model and bump its version so other workers follow.
+
+    The caller owns the transaction and must commit.
+    """
+
+    values = {"provider": provider, "model_name": model_name, "embedding_model": embedding_model}
+    result = db.session.execute(
+        update(ActiveModel)
+        .where(ActiveModel.id == ACTIVE_MODEL_ROW_ID)
+        .values(version=ActiveModel.version + 1, **values)
+    )
+    if result.rowcount == 0:
+        try:
+            with db.session.begin_nested():
+                db.session.add(ActiveModel(id=ACTIVE_MODEL_ROW_ID, version=1, **values))
+        except IntegrityError:
+            # another worker created the row first; bump it like any other update
+            db.session.execute(
+                update(ActiveModel)
+                .where(ActiveModel.id == ACTIVE_MODEL_ROW_ID)
+                .values(version=ActiveModel.version + 1, **values)
+            )
+    return db.session.get(ActiveModel, ACTIVE_MODEL_ROW_ID, populate_existing=True)
+
+
+class ActiveModelTracker:
+    """Swaps the local adapter when the shared active-model version changes.
+
+    ``sync`` reads a single integer by primary key and does so at most once
+    per ``interval`` seconds, so it is safe to call on every request. Until a
+    model is published, the service runs the config file's default adapter.
+    """
+
+    def __init__(self, service: LLMService, build_adapter: AdapterBuilder, interval: float = 1.0):
+        self._service = service
+        self._build_adapter = build_adapter
+        self.interval = interval
+        self.version: Optional[int] = None
+        self.active: Optional[Tuple[str, str]] = None  # (provider, model) switched to, if any
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def sync(self) -> None:
+        if time.monotonic() < self._next_check:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.interval
+            try:
+                version = db.session.execute(
+                    select(ActiveModel.version).where(ActiveModel.id == ACTIVE_MODEL_ROW_ID)
+                ).scalar()
+            except SQLAlchemyError as exc:
+                db.session.rollback()
+                logger.warning("Failed to read active model version: %s", exc)
+                return
+            if version is None or version == self.version:
+                return
+            row = db.session.get(ActiveModel, ACTIVE_MODEL_ROW_ID)
+            self.apply(row)
+        finally:
+            self._lock.release()
+
+    def apply(self, row: ActiveModel) -> None:
+        """Switch this process to ``row`` unless it is already on that version."""
+
+        if row.version == self.version:
+            return
+        try:
+            adapter = self._build_adapter(row.provider, row.model_name, row.embedding_model)
+        except (ImportError, KeyError, OSError, RuntimeError, ValueError) as exc:
+            # keep serving the current adapter; retrying every request would not help
+            logger.error("Cannot switch to %s/%s: %s", row.provider, row.model_name, exc)
+        else:
+            self.adopt(row, adapter)
+            logger.info("Switched to %s/%s (version %s)", row.provider, row.model_name, row.version)
+        self.version = row.version
+
+    def adopt(self, row: ActiveModel, adapter: LLMAdapter) -> None:
+        """Install an adapter already built for ``row`` (e.g. by the worker that published it)."""
+
+        self._service.set_adapter(adapter)
+        self.version = row.version
+        self.active = (row.provider, row.model_name)
+
+    def config_reloaded(self, previous: Optional[LLMConfig], config: LLMConfig) -> None:
+        """Follow a reloaded config file.
+
+        Without an active model, a changed default rebuilds the adapter on the
+        next call. An active model that left the file keeps serving until
+        another one is published.
+        """
+
+        if self.active is None:
+            default = (config.default_provider, config.default_model)
+            if previous is not None and default != (previous.default_provider, previous.default_model):
+                self._service.reset_adapter()
+                logger.info("Default model changed to %s/%s", *default)
+            return
+        provider, model_name = self.active
+        if not any(entry.provider == provider and entry.name == model_name for entry in config.iter_models()):
+            logger.warning("Active model %s/%s is no longer in the config; still serving it", provider, model_name)
+
+
+__all__ = ["ACTIVE_MODEL_ROW_ID", "ActiveModelTracker", "publish_active_model"]
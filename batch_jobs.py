@@ -0,0 +1,502 @@
+"""Offline batch chat processing backed by a bounded worker pool and DB-leased jobs."""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import IO, Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from flask import Flask
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from llm.base import LLMError
+from llm.service import LLMService
+from models import BatchJob, BatchStatus, ChatMessage, Sender, db
+
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_PROMPTS = 50_000
+PROGRESS_FLUSH_INTERVAL_SECONDS = 1.0
+CLAIM_CANDIDATES = 8
+SPOOL_UPLOAD_GRACE_SECONDS = 3600
+
+
+class BatchJobError(Exception):
+    """Wraps validation failures for batch submissions."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def input_path(batch_dir: str, job_id: str) -> str:
+    return os.path.join(batch_dir, f"{job_id}.input.ndjson")
+
+
+def results_path(batch_dir: str, job_id: str) -> str:
+    return os.path.join(batch_dir, f"{job_id}.results.ndjson")
+
+
+def spool_batch_input(lines: Iterable[bytes], destination: str) -> int:
+    """Validate NDJSON prompts and write them to ``destination`` line by line.
+
+    Each non-blank line must be a JSON object with a non-empty ``message``; an
+    optional ``id`` is echoed back in the results. Returns the prompt count.
+    """
+
+    total = 0
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    try:
+        with open(destination, "w", encoding="utf-8") as spool:
+            for line_number, raw_line in enumerate(lines, start=1):
+                line = raw_line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    raise BatchJobError(f"line {line_number}: invalid JSON")
+                if not isinstance(item, dict):
+                    raise BatchJobError(f"line {line_number}: JSON object expected")
+                raw_message = item.get("message")
+                message = raw_message.strip() if isinstance(raw_message, str) else ""
+                if not message:
+                    raise BatchJobError(f"line {line_number}: message is required")
+                total += 1
+                if total > MAX_BATCH_PROMPTS:
+                    raise BatchJobError(f"batch exceeds {MAX_BATCH_PROMPTS} prompts", 413)
+                spool.write(json.dumps({"index": total - 1, "id": item.get("id"), "message": message}))
+                spool.write("\n")
+    except BatchJobError:
+        os.remove(destination)
+        raise
+    if total == 0:
+        os.remove(destination)
+        raise BatchJobError("at least one prompt is required")
+    return total
+
+
+def _iter_spooled_prompts(spool: IO[str]) -> Iterator[Dict]:
+    for line in spool:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _read_results(path: str) -> Tuple[Set[int], int, int]:
+    """Return the prompt indexes already answered in ``path`` and the completed/failed counts.
+
+    A line torn by a crash mid-write is cut off so that resumed results can be
+    appended after it.
+    """
+
+    answered: Set[int] = set()
+    completed = failed = 0
+    if not os.path.exists(path):
+        return answered, completed, failed
+    valid_size = 0
+    with open(path, "rb+") as results:
+        for line in results:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            valid_size += len(line)
+            answered.add(result["index"])
+            if "error" in result:
+                failed += 1
+            else:
+                completed += 1
+        results.truncate(valid_size)
+    return answered, completed, failed
+
+
+class _LeaseLost(Exception):
+    """Raised when another dispatcher has taken over the job being run."""
+
+
+def _new_owner_id() -> str:
+    return f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class BatchJobRunner:
+    """Runs queued batch jobs through the LLM service on a bounded thread pool.
+
+    Each process has one dispatcher thread, started on first use. It claims
+    the oldest claimable job from the ``batch_jobs`` table and feeds its
+    prompts to a pool of ``max_workers`` threads, so batch traffic in one
+    process never uses more than ``max_workers`` concurrent LLM calls; under
+    ``gunicorn -w N`` every worker dispatches its own job. Interactive
+    requests are served by the web workers as usual.
+
+    A claim is a lease: the dispatcher records itself as ``owner`` and renews
+    ``heartbeat_at`` at every progress flush. A running job whose heartbeat is
+    older than ``lease_seconds`` is claimed again by any live dispatcher and
+    resumes after the prompts already in its results file, so jobs survive a
+    worker exit as long as ``batch_dir`` is shared between the workers. The
+    old owner notices the takeover at its next flush and stops; prompts it
+    answered in that last interval may appear twice in the results.
+    ``on_progress`` runs in the dispatcher's app context at every progress
+    flush, which lets long jobs pick up a model switch made elsewhere.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        service: LLMService,
+        batch_dir: str,
+        system_prompt: str,
+        max_workers: int = 2,
+        on_progress: Optional[Callable[[], None]] = None,
+        lease_seconds: float = 60.0,
+        poll_seconds: float = 5.0,
+    ):
+        self._app = app
+        self._service = service
+        self.batch_dir = batch_dir
+        self._system_prompt = system_prompt
+        self._max_workers = max(1, max_workers)
+        self._on_progress = on_progress
+        # a lease must outlive a few missed flushes
+        self._lease_seconds = max(lease_seconds, PROGRESS_FLUSH_INTERVAL_SECONDS * 5)
+        self._poll_seconds = max(poll_seconds, 0.1)
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="lockno-batch")
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._owner = _new_owner_id()
+        self._dispatcher_pid: Optional[int] = None
+
+    def start(self) -> None:
+        """Start this process's dispatcher thread unless it is already running.
+
+        Cheap enough to call on every request. The pid check makes a forked
+        worker start its own dispatcher instead of trusting the parent's.
+        """
+
+        if self._dispatcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._dispatcher_pid == os.getpid():
+                return
+            self._owner = _new_owner_id()
+            dispatcher = threading.Thread(target=self._dispatch_loop, name="lockno-batch-dispatcher", daemon=True)
+            dispatcher.start()
+            self._dispatcher_pid = os.getpid()
+
+    def submit(self, job_id: str) -> None:
+        """Wake the dispatcher for a newly queued job."""
+
+        self.start()
+        self._wake.set()
+
+    def recover(self, resume: bool = False) -> Tuple[int, int]:
+        """Settle jobs that no dispatcher is working on.
+
+        These are pending jobs older than the lease and running jobs whose
+        heartbeat has expired. Running servers reclaim them on their own, so
+        this is for when none will be started; claims are atomic, so it is
+        safe to run alongside them. With ``resume`` each job is run to
+        completion in the foreground, skipping prompts already answered;
+        otherwise it is marked failed and its partial results are kept.
+        Input spools of settled jobs are removed. Returns ``(resumed, failed)``.
+        """
+
+        resumed = failed = 0
+        if resume:
+            while True:
+                job_id = self._claim_next(self._stale_condition())
+                if job_id is None:
+                    break
+                if self._run_job(job_id) == BatchStatus.FAILED:
+                    failed += 1
+                else:
+                    resumed += 1
+        else:
+            stale = self._stale_condition()
+            job_ids = db.session.execute(
+                select(BatchJob.id).where(stale).order_by(BatchJob.created_at.asc())
+            ).scalars().all()
+            for job_id in job_ids:
+                _, completed, errors = _read_results(results_path(self.batch_dir, job_id))
+                settled = db.session.execute(
+                    update(BatchJob)
+                    .where(BatchJob.id == job_id, stale)
+                    .values(
+                        status=BatchStatus.FAILED,
+                        error="interrupted: its worker stopped",
+                        completed=completed,
+                        failed=errors,
+                        owner=self._owner,
+                        finished_at=datetime.now(timezone.utc),
+                    )
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.session.commit()
+                if settled:
+                    failed += 1
+        self._remove_orphaned_spools()
+        return resumed, failed
+
+    def cancel(self, job_id: str) -> None:
+        """Signal a job running in this process; others notice the DB flag."""
+
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    job_id = self._claim_next(self._claimable_condition())
+                    if job_id is not None:
+                        self._run_job(job_id)
+                        continue
+            except SQLAlchemyError as exc:
+                logger.warning("Batch dispatcher could not claim a job: %s", exc)
+            self._wake.wait(self._poll_seconds)
+
+    def _lease_cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self._lease_seconds)
+
+    def _claimable_condition(self):
+        """Pending jobs, and running jobs whose dispatcher stopped renewing the lease."""
+
+        return or_(
+            BatchJob.status == BatchStatus.PENDING,
+            and_(
+                BatchJob.status == BatchStatus.RUNNING,
+                or_(BatchJob.heartbeat_at.is_(None), BatchJob.heartbeat_at < self._lease_cutoff()),
+            ),
+        )
+
+    def _stale_condition(self):
+        """Like ``_claimable_condition``, minus pending jobs a live server may be about to claim."""
+
+        return and_(
+            self._claimable_condition(),
+            or_(BatchJob.status != BatchStatus.PENDING, BatchJob.created_at < self._lease_cutoff()),
+        )
+
+    def _claim_next(self, condition) -> Optional[str]:
+        """Take the lease on the oldest job matching ``condition``; return its id, or ``None``."""
+
+        candidates = db.session.execute(
+            select(BatchJob.id, BatchJob.status)
+            .where(condition)
+            .order_by(BatchJob.created_at.asc())
+            .limit(CLAIM_CANDIDATES)
+        ).all()
+        db.session.commit()
+        for job_id, status in candidates:
+            # another dispatcher may have claimed it since the select; only one update matches
+            claimed = db.session.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, condition)
+                .values(status=BatchStatus.RUNNING, owner=self._owner, heartbeat_at=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                if status == BatchStatus.RUNNING:
+                    logger.warning("Reclaimed batch job %s after its lease expired", job_id)
+                return job_id
+        return None
+
+    def _run_job(self, job_id: str) -> Optional[BatchStatus]:
+        """Run a claimed job; return the status this runner settled it with, or ``None``."""
+
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+        status = None
+        try:
+            status = self._dispatch(job_id)
+        except _LeaseLost:
+            logger.warning("Batch job %s was taken over by another dispatcher", job_id)
+        except Exception as exc:  # pragma: no cover - defensive, keeps the job row honest
+            logger.exception("Batch job %s failed", job_id)
+            db.session.rollback()
+            if self._finish(job_id, BatchStatus.FAILED, error=str(exc)):
+                status = BatchStatus.FAILED
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+        if status is not None:
+            try:
+                os.remove(input_path(self.batch_dir, job_id))
+            except OSError:
+                pass
+        return status
+
+    def _dispatch(self, job_id: str) -> Optional[BatchStatus]:
+        job = db.session.get(BatchJob, job_id, populate_existing=True)
+        if job is None:
+            return None
+        if job.cancel_requested:
+            return BatchStatus.CANCELLED if self._finish(job_id, BatchStatus.CANCELLED) else None
+        if not os.path.exists(input_path(self.batch_dir, job_id)):
+            error = "batch input is missing"
+            return BatchStatus.FAILED if self._finish(job_id, BatchStatus.FAILED, error=error) else None
+
+        cancel_event = self._cancel_events[job_id]
+        max_in_flight = self._max_workers * 2
+        in_flight: Set[Future] = set()
+        # a resumed or reclaimed job continues after the prompts already answered
+        answered, completed, failed = _read_results(results_path(self.batch_dir, job_id))
+        last_flush = time.monotonic()
+
+        with open(input_path(self.batch_dir, job_id), "r", encoding="utf-8") as spool, open(
+            results_path(self.batch_dir, job_id), "a", encoding="utf-8"
+        ) as results:
+            pending = (prompt for prompt in _iter_spooled_prompts(spool) if prompt["index"] not in answered)
+            exhausted = cancelled = False
+            try:
+                while True:
+                    while not (exhausted or cancelled) and len(in_flight) < max_in_flight:
+                        if cancel_event.is_set():
+                            cancelled = True
+                            break
+                        prompt = next(pending, None)
+                        if prompt is None:
+                            exhausted = True
+                            break
+                        in_flight.add(self._executor.submit(self._run_prompt, prompt))
+                    if not in_flight:
+                        break
+                    # the timeout keeps the heartbeat going while LLM calls are slow;
+                    # in-flight prompts are already paid for, so a cancel still keeps their results
+                    done, in_flight = wait(
+                        in_flight, timeout=PROGRESS_FLUSH_INTERVAL_SECONDS, return_when=FIRST_COMPLETED
+                    )
+                    ok, err = self._write_results(results, done)
+                    completed, failed = completed + ok, failed + err
+                    if time.monotonic() - last_flush >= PROGRESS_FLUSH_INTERVAL_SECONDS:
+                        if self._flush_progress(job_id, completed, failed):
+                            cancel_event.set()
+                        if self._on_progress is not None:
+                            self._on_progress()
+                        last_flush = time.monotonic()
+            except _LeaseLost:
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+        self._flush_progress(job_id, completed, failed)
+        status = BatchStatus.CANCELLED if cancelled else BatchStatus.COMPLETED
+        return status if self._finish(job_id, status) else None
+
+    def _run_prompt(self, prompt: Dict) -> Dict:
+        messages = [
+            ChatMessage(session_id="", sender=Sender.SYSTEM, message=self._system_prompt),
+            ChatMessage(session_id="", sender=Sender.USER, message=prompt["message"]),
+        ]
+        result = {"index": prompt["index"], "id": prompt.get("id")}
+        try:
+            reply = self._service.chat(messages=messages)
+        except LLMError as exc:
+            result["error"] = str(exc)
+            return result
+        result["reply"] = reply.message
+        return result
+
+    @staticmethod
+    def _write_results(results: IO[str], done: Iterable[Future]) -> Tuple[int, int]:
+        completed = failed = 0
+        for future in done:
+            result = future.result()
+            results.write(json.dumps(result))
+            results.write("\n")
+            if "error" in result:
+                failed += 1
+            else:
+                completed += 1
+        results.flush()
+        return completed, failed
+
+    def _flush_progress(self, job_id: str, completed: int, failed: int) -> bool:
+        """Persist counters, renew the lease and report whether cancellation was requested.
+
+        Raises ``_LeaseLost`` if the job is no longer running under this dispatcher.
+        """
+
+        try:
+            renewed = db.session.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.owner == self._owner, BatchJob.status == BatchStatus.RUNNING)
+                .values(completed=completed, failed=failed, heartbeat_at=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            cancel_requested = db.session.execute(
+                select(BatchJob.cancel_requested).where(BatchJob.id == job_id)
+            ).scalar()
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            logger.warning("Failed to record progress for batch job %s: %s", job_id, exc)
+            return False
+        if not renewed:
+            raise _LeaseLost(job_id)
+        return bool(cancel_requested)
+
+    def _finish(self, job_id: str, status: BatchStatus, error: Optional[str] = None) -> bool:
+        """Settle a job this dispatcher still owns; return whether the row was updated."""
+
+        try:
+            finished = db.session.execute(
+                update(BatchJob)
+                .where(BatchJob.id == job_id, BatchJob.owner == self._owner, BatchJob.status == BatchStatus.RUNNING)
+                .values(status=status, error=error, finished_at=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            logger.error("Failed to finalize batch job %s: %s", job_id, exc)
+            return False
+        return bool(finished)
+
+    def _remove_orphaned_spools(self) -> None:
+        """Delete input spools of settled jobs, and of rows never created after an upload."""
+
+        suffix = ".input.ndjson"
+        names = os.listdir(self.batch_dir) if os.path.isdir(self.batch_dir) else ()
+        job_ids = [name[: -len(suffix)] for name in names if name.endswith(suffix)]
+        if not job_ids:
+            return
+        statuses = dict(
+            db.session.execute(select(BatchJob.id, BatchJob.status).where(BatchJob.id.in_(job_ids))).all()
+        )
+        for job_id in job_ids:
+            path = input_path(self.batch_dir, job_id)
+            status = statuses.get(job_id)
+            if status in (BatchStatus.PENDING, BatchStatus.RUNNING):
+                continue
+            try:
+                # an upload being spooled has no row yet
+                if status is None and time.time() - os.path.getmtime(path) < SPOOL_UPLOAD_GRACE_SECONDS:
+                    continue
+                os.remove(path)
+            except OSError:
+                pass
+
+
+__all__ = [
+    "MAX_BATCH_PROMPTS",
+    "BatchJobError",
+    "BatchJobRunner",
+    "input_path",
+    "results_path",
+    "spool_batch_input",
+]
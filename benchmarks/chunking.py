@@ -0,0 +1,72 @@
+"""Throughput benchmark for the streaming document chunker.
+
+Chunks each sample and reports throughput in MB/s, the number of chunks,
+their average fill (tokens per chunk / ``--max-tokens``) and the peak
+memory allocated while chunking, which should stay flat as documents grow.
+Pass files to benchmark real uploads; without arguments the repository's
+Markdown files are repeated up to ``--size-mb`` megabytes.
+
+Usage: ``python benchmarks/chunking.py [--size-mb N] [--max-tokens N] [--overlap N] [FILE ...]``.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import mimetypes
+import os
+import sys
+import time
+import tracemalloc
+
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, REPO_DIR)
+
+from chunking import iter_document_chunks  # noqa: E402
+
+
+def _default_samples(size_mb: int):
+    paths = sorted(glob.glob(os.path.join(REPO_DIR, "*.md")))
+    corpus = b"\n\n".join(open(path, "rb").read() for path in paths)
+    repeats = max(1, size_mb * 1024 * 1024 // len(corpus))
+    return {f"repo markdown x{repeats}.md": corpus * repeats}
+
+
+def _chunk_all(data: bytes, name: str, max_tokens: int, overlap: int):
+    mime_type = mimetypes.guess_type(name)[0] or "text/plain"
+    count = tokens = 0
+    for chunk in iter_document_chunks(data, mime_type, name, max_tokens, overlap):
+        count += 1
+        tokens += chunk.tokens
+    return count, tokens
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--overlap", type=int, default=32)
+    args = parser.parse_args()
+
+    samples = {os.path.basename(path): open(path, "rb").read() for path in args.files} or _default_samples(args.size_mb)
+
+    print(f"{'sample':<32}{'MB':>8}{'MB/s':>8}{'chunks':>9}{'fill':>7}{'peak KiB':>10}")
+    for name, data in samples.items():
+        megabytes = len(data) / (1024 * 1024)
+        started = time.perf_counter()
+        count, tokens = _chunk_all(data, name, args.max_tokens, args.overlap)
+        elapsed = time.perf_counter() - started
+
+        # tracemalloc slows allocation-heavy code, so measure memory in a separate pass
+        tracemalloc.start()
+        _chunk_all(data, name, args.max_tokens, args.overlap)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        fill = tokens / (count * args.max_tokens) if count else 0.0
+        print(f"{name[:31]:<32}{megabytes:>8.1f}{megabytes / elapsed:>8.1f}{count:>9}{fill:>7.2f}{peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Size vs CPU benchmark for the payload compression codecs.
+
+Compresses each sample with every available codec and reports the stored
+size ratio and compress/decompress throughput in MB/s. Pass files to
+benchmark real payloads (e.g. exported .md/.txt/.docx uploads); without
+arguments the repository's own Markdown and Python sources are used.
+
+Usage: ``python benchmarks/compression.py [--repeat N] [FILE ...]``.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, REPO_DIR)
+
+import compression  # noqa: E402
+
+
+def _available_codecs():
+    codecs = [compression.CODEC_ZLIB]
+    try:
+        compression.configure(compression.CODEC_ZSTD)
+    except compression.CompressionError:
+        print("zstandard not installed; skipping zstd", file=sys.stderr)
+    else:
+        codecs.append(compression.CODEC_ZSTD)
+    return codecs
+
+
+def _default_samples():
+    paths = sorted(glob.glob(os.path.join(REPO_DIR, "*.md")) + glob.glob(os.path.join(REPO_DIR, "**", "*.py"), recursive=True))
+    return {"repo sources": b"\n".join(open(path, "rb").read() for path in paths)}
+
+
+def _timed(func, data: bytes, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(data)
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    samples = {os.path.basename(path): open(path, "rb").read() for path in args.files} or _default_samples()
+    codecs = _available_codecs()
+
+    print(f"{'sample':<24}{'codec':<7}{'bytes':>11}{'stored':>11}{'ratio':>8}{'comp MB/s':>11}{'decomp MB/s':>13}")
+    for name, data in samples.items():
+        megabytes = len(data) / (1024 * 1024)
+        for codec in codecs:
+            packed = compression.compress(data, codec)
+            assert compression.decompress(packed, codec) == data
+            compress_s = _timed(lambda payload: compression.compress(payload, codec), data, args.repeat)
+            decompress_s = _timed(lambda payload: compression.decompress(payload, codec), packed, args.repeat)
+            print(
+                f"{name[:23]:<24}{codec:<7}{len(data):>11}{len(packed):>11}{len(data) / len(packed):>8.2f}"
+                f"{megabytes / compress_s:>11.1f}{megabytes / decompress_s:>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
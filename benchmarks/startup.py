@@ -0,0 +1,89 @@
+"""Cold-start benchmark for the LocKno app.
+
+Each sample runs in a fresh interpreter and reports, in milliseconds:
+
+- ``import``: ``import main``
+- ``create_app``: building the app via the factory
+- ``first_request``: the first ``GET /api/config/llm`` through the test client
+- ``adapter``: constructing the LLM adapter (deferred until the first LLM call)
+
+Usage: ``python benchmarks/startup.py [--runs N]``. A throwaway SQLite
+database is created and seeded so nothing touches ``lockno.db``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+SETUP_SNIPPET = """
+import main
+from models import db
+app = main.create_app()
+with app.app_context():
+    db.create_all()
+    main.sync_config_table()
+"""
+
+SAMPLE_SNIPPET = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+response = app.test_client().get("/api/config/llm")
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+with app.app_context():
+    main._services().llm_service.adapter
+adapted = time.perf_counter()
+print(json.dumps({
+    "import": (imported - started) * 1000,
+    "create_app": (created - imported) * 1000,
+    "first_request": (served - created) * 1000,
+    "adapter": (adapted - served) * 1000,
+}))
+"""
+
+
+def _run(snippet: str, env: dict) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=REPO_DIR,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        env["LOCKNO_BATCH_DIR"] = os.path.join(workdir, "batch_jobs")
+        _run(SETUP_SNIPPET, env)
+
+        samples = [json.loads(_run(SAMPLE_SNIPPET, env)) for _ in range(args.runs)]
+
+    print(f"{'phase':<14}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for phase in ("import", "create_app", "first_request", "adapter"):
+        values = [sample[phase] for sample in samples]
+        print(f"{phase:<14}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
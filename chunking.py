@@ -0,0 +1,320 @@
+"""Structure-aware, streaming text chunker for stored documents."""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from text_extraction import iter_document_text
+
+
+DEFAULT_CHUNK_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 32
+MAX_BLOCK_CHARS = 64 * 1024  # longer lines and blocks are cut so memory stays bounded
+
+# Han, kana, hangul and their punctuation: tokenizers spend about a token per character
+_CJK = "\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef"
+_WORD_TOKEN_CHARS = 6  # longer words count one token per this many characters
+_TOKEN_RE = re.compile(rf"[{_CJK}]|[^\W{_CJK}]+|[^\w\s{_CJK}]")
+_LONG_WORD_RE = re.compile(rf"[^\W{_CJK}]{{{_WORD_TOKEN_CHARS + 1},}}")
+_HEADING_RE = re.compile(r"(#{1,6})[ \t]+(.*?)[ \t#]*$")
+_FENCE_RE = re.compile(r"(```|~~~)")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+|[。！？][」』”）]*\s*|\n\s*")
+_MAX_CHARS_PER_TOKEN = 16  # longer blocks are split without counting them whole first
+_WORD_RE = re.compile(r"\w+\s*|[^\w\s]\s*")  # token-sized pieces, trailing space kept
+
+
+def approx_token_count(text: str) -> int:
+    """Cheap token estimate: words, punctuation marks and CJK characters.
+
+    Words longer than ``_WORD_TOKEN_CHARS`` count one token per that many
+    characters, so unspaced runs (identifiers, base64, URLs) are not one token.
+    """
+
+    tokens = _TOKEN_RE.subn("", text)[1]
+    for word in _LONG_WORD_RE.findall(text):
+        tokens += (len(word) - 1) // _WORD_TOKEN_CHARS
+    return tokens
+
+
+@dataclass(frozen=True)
+class Chunk:
+    index: int
+    text: str
+    start: int  # character offsets into the extracted text, end exclusive
+    end: int
+    tokens: int
+    heading: str
+
+
+@dataclass
+class _Block:
+    text: str  # content plus the whitespace that follows it
+    start: int
+    heading_level: int = 0
+    heading_title: str = ""
+
+
+@dataclass
+class _Unit:
+    text: str  # includes surrounding whitespace so consecutive units join back losslessly
+    start: int
+    content_start: int
+    content_end: int
+    tokens: int
+    heading: str = ""
+
+
+def _iter_lines(pieces: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    """Yield ``(line, offset)`` with line endings kept, across piece boundaries."""
+
+    pending = ""
+    offset = 0
+    for piece in pieces:
+        pending += piece
+        position = 0
+        while True:
+            newline = pending.find("\n", position)
+            if newline == -1:
+                break
+            line = pending[position:newline + 1]
+            yield line, offset
+            offset += len(line)
+            position = newline + 1
+        pending = pending[position:]
+        while len(pending) > MAX_BLOCK_CHARS:
+            cut = pending.rfind(" ", 0, MAX_BLOCK_CHARS) + 1 or MAX_BLOCK_CHARS
+            yield pending[:cut], offset
+            offset += cut
+            pending = pending[cut:]
+    if pending:
+        yield pending, offset
+
+
+def _iter_blocks(pieces: Iterable[str], markdown: bool) -> Iterator[_Block]:
+    """Group lines into paragraphs, headings and fenced code blocks.
+
+    Blank lines are attached to the block before them, so the blocks tile the
+    text exactly. Blocks longer than ``MAX_BLOCK_CHARS`` are cut at a line
+    boundary.
+    """
+
+    lines: List[str] = []
+    size = start = level = 0
+    title = ""
+    in_fence = closed = False
+
+    for line, offset in _iter_lines(pieces):
+        stripped = line.strip()
+        marker = markdown and stripped[:1] in ("#", "`", "~") and stripped[:1] != ""
+        fence = marker and _FENCE_RE.match(stripped) is not None
+        if lines and size >= MAX_BLOCK_CHARS and (in_fence or stripped):
+            yield _Block("".join(lines), start, level, title)
+            lines = []
+        if in_fence:
+            if not lines:
+                start, size, level, title = offset, 0, 0, ""
+            lines.append(line)
+            size += len(line)
+            if fence:
+                in_fence, closed = False, True
+            continue
+        if not stripped:
+            if lines:
+                lines.append(line)  # trailing blank lines belong to the block
+                size += len(line)
+            continue
+        heading = _HEADING_RE.match(stripped) if marker and not fence else None
+        if lines and (closed or heading or fence or not lines[-1].strip()):
+            yield _Block("".join(lines), start, level, title)
+            lines = []
+        if not lines:
+            start, size, level, title, closed = offset, 0, 0, "", False
+        lines.append(line)
+        size += len(line)
+        if heading:
+            level, title, closed = len(heading.group(1)), heading.group(2), True
+        elif fence:
+            in_fence = True
+    if lines:
+        yield _Block("".join(lines), start, level, title)
+
+
+def _split_spans(text: str, pattern: "re.Pattern[str]") -> Iterator[Tuple[int, int]]:
+    position = 0
+    for match in pattern.finditer(text):
+        if match.end() > position:
+            yield position, match.end()
+            position = match.end()
+    if position < len(text):
+        yield position, len(text)
+
+
+def _make_unit(text: str, start: int, count_tokens: Callable[[str], int]) -> _Unit:
+    content = text.strip()
+    content_start = start + len(text) - len(text.lstrip())
+    return _Unit(text, start, content_start, content_start + len(content), count_tokens(content))
+
+
+def _iter_units(block: _Block, max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[_Unit]:
+    """Split a block into packable units: whole, else by sentence, else by word runs.
+
+    Word runs are kept to an eighth of ``max_tokens`` so that the packer can
+    still fill chunks (and overlaps) tightly around them; a single word over
+    that size is cut by characters.
+    """
+
+    if len(block.text) <= max_tokens * _MAX_CHARS_PER_TOKEN:
+        unit = _make_unit(block.text, block.start, count_tokens)
+        if unit.tokens <= max_tokens:
+            yield unit
+            return
+    run_tokens = max(1, max_tokens // 8)
+    for sentence_start, sentence_end in _split_spans(block.text, _SENTENCE_END_RE):
+        sentence = _make_unit(block.text[sentence_start:sentence_end], block.start + sentence_start, count_tokens)
+        if sentence.tokens <= max_tokens:
+            yield sentence
+            continue
+        words: List[str] = []
+        words_start = sentence.start
+        words_tokens = 0
+        for word_start, word_end in _split_spans(sentence.text, _WORD_RE):
+            word = sentence.text[word_start:word_end]
+            word_tokens = count_tokens(word)
+            if words and words_tokens + word_tokens > run_tokens:
+                yield _make_unit("".join(words), words_start, count_tokens)
+                words, words_tokens = [], 0
+                words_start = sentence.start + word_start
+            if word_tokens > run_tokens:
+                yield from _split_by_chars(word, sentence.start + word_start, run_tokens, word_tokens, count_tokens)
+                words_start = sentence.start + word_end
+                continue
+            words.append(word)
+            words_tokens += word_tokens
+        if words:
+            yield _make_unit("".join(words), words_start, count_tokens)
+
+
+def _split_by_chars(
+    text: str, start: int, limit: int, tokens: int, count_tokens: Callable[[str], int]
+) -> Iterator[_Unit]:
+    """Cut one unbroken run into units of at most ``limit`` tokens.
+
+    Surrounding whitespace rides on the first and last pieces so every piece
+    has content and the pieces still join back into ``text``.
+    """
+
+    lead = len(text) - len(text.lstrip())
+    content_end = len(text.rstrip())
+    step = max(1, (content_end - lead) * limit // tokens)
+    position = 0
+    while position < content_end:
+        piece_start = max(position, lead)
+        end = min(piece_start + step, content_end)
+        while end - piece_start > 1 and count_tokens(text[piece_start:end]) > limit:
+            end = piece_start + (end - piece_start) // 2
+        if end == content_end:
+            end = len(text)
+        yield _make_unit(text[position:end], start + position, count_tokens)
+        position = end
+
+
+def iter_chunks(
+    pieces: Iterable[str],
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+    markdown: bool = False,
+    count_tokens: Callable[[str], int] = approx_token_count,
+) -> Iterator[Chunk]:
+    """Chunk streamed text without holding more than one chunk's worth of it.
+
+    Chunks are packed from whole paragraphs where possible, falling back to
+    sentences and then words for oversized blocks. With ``markdown`` set,
+    fenced code blocks are never split on blank lines and a heading starts a
+    new chunk unless the current one is under half full; short sections are
+    folded into the next chunk rather than each costing an embedding.
+    ``Chunk.heading`` is the heading trail where the chunk starts. Chunks
+    that split a section share up to ``overlap_tokens`` tokens of trailing
+    units.
+    """
+
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be positive")
+    if not 0 <= overlap_tokens < max_tokens:
+        raise ValueError("overlap_tokens must be between 0 and max_tokens")
+
+    pending: List[_Unit] = []
+    pending_tokens = 0
+    trail: List[Tuple[int, str]] = []
+    heading = ""
+    min_section_tokens = max_tokens // 2
+    index = 0
+
+    def emit() -> Chunk:
+        nonlocal index
+        base = pending[0].start
+        text = "".join(unit.text for unit in pending)
+        chunk = Chunk(
+            index=index,
+            text=text[pending[0].content_start - base:pending[-1].content_end - base],
+            start=pending[0].content_start,
+            end=pending[-1].content_end,
+            tokens=pending_tokens,
+            heading=pending[0].heading,
+        )
+        index += 1
+        return chunk
+
+    def carry_overlap() -> None:
+        nonlocal pending, pending_tokens
+        kept: List[_Unit] = []
+        kept_tokens = 0
+        for unit in reversed(pending[1:]):
+            if kept_tokens + unit.tokens > overlap_tokens:
+                break
+            kept.insert(0, unit)
+            kept_tokens += unit.tokens
+        pending, pending_tokens = kept, kept_tokens
+
+    for block in _iter_blocks(pieces, markdown):
+        if block.heading_level:
+            if pending and pending_tokens >= min_section_tokens:
+                yield emit()
+                pending, pending_tokens = [], 0
+            trail = [(level, title) for level, title in trail if level < block.heading_level]
+            trail.append((block.heading_level, block.heading_title))
+            heading = " > ".join(title for _, title in trail)
+        for unit in _iter_units(block, max_tokens, count_tokens):
+            unit.heading = heading
+            if pending and pending_tokens + unit.tokens > max_tokens:
+                yield emit()
+                carry_overlap()
+                while pending and pending_tokens + unit.tokens > max_tokens:
+                    pending_tokens -= pending.pop(0).tokens
+            pending.append(unit)
+            pending_tokens += unit.tokens
+    if pending:
+        yield emit()
+
+
+def iter_document_chunks(
+    data: bytes,
+    mime_type: str,
+    filename: str,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> Iterator[Chunk]:
+    """Extract a stored document's text and chunk it as it is produced."""
+
+    markdown = filename.lower().endswith(".md") or mime_type in ("text/markdown", "text/x-markdown")
+    return iter_chunks(iter_document_text(data, mime_type, filename), max_tokens, overlap_tokens, markdown=markdown)
+
+
+__all__ = [
+    "DEFAULT_CHUNK_TOKENS",
+    "DEFAULT_OVERLAP_TOKENS",
+    "Chunk",
+    "approx_token_count",
+    "iter_chunks",
+    "iter_document_chunks",
+]
@@ -0,0 +1,153 @@
+"""Payload compression codecs for stored messages and documents."""
+from __future__ import annotations
+
+import io
+import threading
+import zlib
+from typing import Iterator, Optional, Tuple
+
+
+CODEC_NONE = "none"
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+SUPPORTED_CODECS = (CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD)
+
+DEFAULT_MIN_SIZE_BYTES = 256  # below this the header overhead eats the gain
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_write_codec = CODEC_NONE
+_min_size = DEFAULT_MIN_SIZE_BYTES
+_zstd_local = threading.local()
+
+
+class CompressionError(Exception):
+    """Raised for unknown codecs or payloads that fail to decode."""
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise CompressionError("zstd codec requires the 'zstandard' package") from exc
+    return zstandard
+
+
+def _zstd_compressor():
+    # zstandard contexts are not thread-safe, so keep one per thread
+    compressor = getattr(_zstd_local, "compressor", None)
+    if compressor is None:
+        compressor = _zstd_local.compressor = _zstd().ZstdCompressor(level=ZSTD_LEVEL)
+    return compressor
+
+
+def _zstd_decompressor():
+    decompressor = getattr(_zstd_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _zstd_local.decompressor = _zstd().ZstdDecompressor()
+    return decompressor
+
+
+def configure(codec: str = CODEC_NONE, min_size: int = DEFAULT_MIN_SIZE_BYTES) -> None:
+    """Set the codec used for newly written payloads."""
+
+    global _write_codec, _min_size
+    codec = (codec or CODEC_NONE).strip().lower()
+    if codec not in SUPPORTED_CODECS:
+        raise CompressionError(f"unsupported compression codec: {codec}")
+    if codec == CODEC_ZSTD:
+        _zstd()
+    _write_codec = codec
+    _min_size = min_size
+
+
+def write_codec() -> str:
+    return _write_codec
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    if codec == CODEC_ZSTD:
+        return _zstd_compressor().compress(data)
+    raise CompressionError(f"unsupported compression codec: {codec}")
+
+
+def decompress(data: bytes, codec: Optional[str]) -> bytes:
+    if not codec or codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZLIB:
+        try:
+            return zlib.decompress(data)
+        except zlib.error as exc:
+            raise CompressionError("corrupt zlib payload") from exc
+    if codec == CODEC_ZSTD:
+        zstandard = _zstd()
+        try:
+            return _zstd_decompressor().decompress(data)
+        except zstandard.ZstdError as exc:
+            raise CompressionError("corrupt zstd payload") from exc
+    raise CompressionError(f"unsupported compression codec: {codec}")
+
+
+def iter_decompress(data: bytes, codec: Optional[str], chunk_size: int) -> Iterator[bytes]:
+    """Yield the decoded payload piece by piece instead of as one buffer."""
+
+    if not codec or codec == CODEC_NONE:
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+        return
+    if codec == CODEC_ZLIB:
+        decoder = zlib.decompressobj()
+        try:
+            for offset in range(0, len(data), chunk_size):
+                piece = decoder.decompress(data[offset:offset + chunk_size])
+                if piece:
+                    yield piece
+            tail = decoder.flush()
+        except zlib.error as exc:
+            raise CompressionError("corrupt zlib payload") from exc
+        if tail:
+            yield tail
+        return
+    if codec == CODEC_ZSTD:
+        zstandard = _zstd()
+        try:
+            yield from _zstd_decompressor().read_to_iter(io.BytesIO(data), read_size=chunk_size, write_size=chunk_size)
+        except zstandard.ZstdError as exc:
+            raise CompressionError("corrupt zstd payload") from exc
+        return
+    raise CompressionError(f"unsupported compression codec: {codec}")
+
+
+def encode(data: bytes, codec: Optional[str] = None) -> Tuple[bytes, str]:
+    """Compress ``data`` with ``codec`` (default: the configured one).
+
+    Returns the stored bytes and the codec marker to persist next to them;
+    payloads that are small or do not shrink are kept as-is under ``none``.
+    """
+
+    codec = codec or _write_codec
+    if codec == CODEC_NONE or len(data) < _min_size:
+        return data, CODEC_NONE
+    packed = compress(data, codec)
+    if len(packed) >= len(data):
+        return data, CODEC_NONE
+    return packed, codec
+
+
+__all__ = [
+    "CODEC_NONE",
+    "CODEC_ZLIB",
+    "CODEC_ZSTD",
+    "SUPPORTED_CODECS",
+    "CompressionError",
+    "compress",
+    "configure",
+    "decompress",
+    "encode",
+    "iter_decompress",
+    "write_codec",
+]
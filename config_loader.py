@@ -2,8 +2,16 @@
 from __future__ import annotations
 
 import json
+import logging
+import os
+import threading
+import time
 from dataclasses import dataclass
-from typing import Dict, Iterator, Tuple
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterator, Mapping, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -13,26 +21,78 @@ class ModelEntry:
     model_type: str
 
 
+def _freeze(value: Any) -> Any:
+    """Return a read-only copy of parsed JSON: objects become mapping proxies, arrays tuples."""
+
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _check_shape(raw: Any) -> None:
+    """Raise ``ValueError`` unless ``raw`` has the layout the rest of this module reads."""
+
+    def check_strings(block: Mapping[str, Any], keys: Tuple[str, ...], where: str) -> None:
+        for key in keys:
+            if block.get(key) is not None and not isinstance(block[key], str):
+                raise ValueError(f"{where}.{key} must be a string")
+
+    if not isinstance(raw, dict):
+        raise ValueError("config must be a JSON object")
+    providers = raw.get("providers")
+    providers = {} if providers is None else providers
+    if not isinstance(providers, dict):
+        raise ValueError("providers must be an object")
+    for name, data in providers.items():
+        data = {} if data is None else data
+        if not isinstance(data, dict):
+            raise ValueError(f"providers.{name} must be an object")
+        models = data.get("models")
+        models = [] if models is None else models
+        if not isinstance(models, list):
+            raise ValueError(f"providers.{name}.models must be a list")
+        for index, model in enumerate(models):
+            if not isinstance(model, dict):
+                raise ValueError(f"providers.{name}.models[{index}] must be an object")
+            check_strings(model, ("name", "type"), f"providers.{name}.models[{index}]")
+    default_block = raw.get("default")
+    default_block = {} if default_block is None else default_block
+    if not isinstance(default_block, dict):
+        raise ValueError("default must be an object")
+    check_strings(default_block, ("provider", "model"), "default")
+
+
 class LLMConfig:
-    """Loads provider/model configuration from a JSON file."""
+    """Loads provider/model configuration from a JSON file.
+
+    Instances are snapshots: ``raw`` and ``providers`` are frozen at
+    construction, so a reload builds a new one and swaps the reference instead.
+    A file with the wrong structure raises ``ValueError``, like invalid JSON.
+    """
 
     def __init__(self, path: str):
         self.path = path
-        self.raw = self._load_file(path)
-        self.providers: Dict[str, Dict] = {}
-        for name, data in self.raw.get("providers", {}).items():
+        raw = self._load_file(path)
+        _check_shape(raw)
+        self.raw: Mapping[str, Any] = _freeze(raw)
+        providers: Dict[str, Mapping[str, Any]] = {}
+        for name, data in (self.raw.get("providers") or {}).items():
             key = (name or "").strip().lower()
             if not key:
                 continue
-            self.providers[key] = data or {}
+            providers[key] = data or MappingProxyType({})
+        self.providers: Mapping[str, Mapping[str, Any]] = MappingProxyType(providers)
 
-        default_block = self.raw.get("default", {})
+        default_block = self.raw.get("default") or {}
         self.default_provider = (default_block.get("provider") or "").strip().lower()
         self.default_model = (default_block.get("model") or "").strip()
         if not self.default_provider and self.providers:
             self.default_provider = next(iter(self.providers))
         if not self.default_model and self.default_provider:
-            self.default_model = (self.providers.get(self.default_provider, {}).get("models", [{}])[0].get("name") or "").strip()
+            models = self.providers.get(self.default_provider, {}).get("models") or ()
+            self.default_model = (models[0].get("name") or "").strip() if models else ""
 
     @staticmethod
     def _load_file(path: str) -> Dict:
@@ -45,16 +105,92 @@ class LLMConfig:
             raise KeyError(provider)
         chat_model = (self.default_model if provider == self.default_provider else "").strip()
         if not chat_model:
-            models = provider_cfg.get("models", [])
-            chat_model = (models[0].get("name") if models else "").strip()
+            models = provider_cfg.get("models") or ()
+            chat_model = (models[0].get("name") or "").strip() if models else ""
         embed_model = chat_model
         return chat_model, embed_model
 
     def iter_models(self) -> Iterator[ModelEntry]:
         for provider_name, data in self.providers.items():
-            for model in data.get("models", []):
+            for model in data.get("models") or ():
                 model_name = (model.get("name") or "").strip()
                 model_type = (model.get("type") or "unknown").strip()
                 if not model_name:
                     continue
                 yield ModelEntry(provider=provider_name, name=model_name, model_type=model_type)
+
+    def model_keys(self) -> FrozenSet[Tuple[str, str, str]]:
+        return frozenset((entry.provider, entry.name, entry.model_type) for entry in self.iter_models())
+
+
+class ConfigWatcher:
+    """Serves the current ``LLMConfig`` snapshot and reloads it when the file changes.
+
+    The file is parsed on the first ``current`` call rather than at
+    construction. ``refresh`` only stat()s it, at most once per ``interval``
+    seconds, so callers can invoke it on every request; a worker that has not
+    parsed the file yet just records the stat baseline. A file that fails to
+    parse is logged and the previous snapshot stays active.
+    """
+
+    def __init__(self, path: str, interval: float = 2.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._has_baseline = False
+        self._config: Optional[LLMConfig] = None
+        self._next_check = 0.0
+
+    def current(self) -> LLMConfig:
+        config = self._config
+        if config is None:
+            with self._lock:
+                if self._config is None:
+                    signature = self._stat_signature()
+                    self._config = LLMConfig(self.path)
+                    self._signature, self._has_baseline = signature, True
+                    self._next_check = time.monotonic() + self.interval
+                config = self._config
+        return config
+
+    def refresh(self) -> Optional[LLMConfig]:
+        """Swap in a new snapshot if the file changed; return it, else ``None``."""
+
+        if self.interval <= 0 or time.monotonic() < self._next_check:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return None  # another thread is already checking
+        try:
+            self._next_check = time.monotonic() + self.interval
+            signature = self._stat_signature()
+            if not self._has_baseline:
+                # nothing parsed yet: later changes are measured from the file as it is now
+                self._signature, self._has_baseline = signature, True
+                return None
+            if signature == self._signature:
+                return None
+            self._signature = signature
+            try:
+                config = LLMConfig(self.path)
+            except (OSError, ValueError) as exc:
+                logger.error("Ignoring invalid config file %s: %s", self.path, exc)
+                return None
+            self._config = config
+            logger.info("Reloaded LLM config from %s", self.path)
+            return config
+        finally:
+            self._lock.release()
+
+    @property
+    def loaded(self) -> Optional[LLMConfig]:
+        """The active snapshot, or ``None`` if the file has not been parsed yet."""
+
+        return self._config
+
+    def _stat_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,371 @@
+"""Streaming NDJSON export and import of chat messages and documents."""
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import insert, select
+
+from compression import CODEC_NONE, CompressionError, decompress
+from dedup import MINHASH_PERMUTATIONS, STATUS_LINKED, band_keys, signature_from_bytes
+from models import ChatMessage, Document, DocumentLSHBand, Sender, db
+from retrieval_cache import bump_index_generation
+
+
+EXPORT_FORMAT = "lockno-export"
+EXPORT_VERSION = 1
+MESSAGE_BATCH_SIZE = 1000
+DOCUMENT_BATCH_SIZE = 16  # rows carry blobs of up to 15 MB each
+
+_messages = ChatMessage.__table__
+_documents = Document.__table__
+_bands = DocumentLSHBand.__table__
+
+
+class DataTransferError(Exception):
+    """Wraps validation failures for imported records."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+        self.imported: Dict[str, int] = {}
+
+
+def _b64(data: Optional[bytes]) -> Optional[str]:
+    return base64.b64encode(data).decode("ascii") if data is not None else None
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def iter_export(
+    messages: bool = True,
+    documents: bool = True,
+    session_id: Optional[str] = None,
+    batch_size: int = MESSAGE_BATCH_SIZE,
+) -> Iterator[str]:
+    """Yield NDJSON lines: a header, then messages, then documents.
+
+    Rows are read through server-side cursors (``yield_per``) as plain column
+    tuples, so memory stays flat however large the database is. Payloads are
+    written as stored: compressed ones keep their codec and are base64-encoded.
+    Documents are not tied to sessions, so a ``session_id`` export has
+    messages only.
+    """
+
+    yield _line({"type": "header", "format": EXPORT_FORMAT, "version": EXPORT_VERSION,
+                 "exported_at": datetime.now(timezone.utc).isoformat()})
+    if messages:
+        yield from _export_messages(session_id, batch_size)
+    if documents and session_id is None:
+        yield from _export_documents()
+
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record) + "\n"
+
+
+def _export_messages(session_id: Optional[str], batch_size: int) -> Iterator[str]:
+    query = select(
+        _messages.c.session_id,
+        _messages.c.sender,
+        _messages.c.message,
+        _messages.c.message_data,
+        _messages.c.message_codec,
+        _messages.c.timestamp,
+    ).order_by(_messages.c.id)
+    if session_id is not None:
+        query = query.where(_messages.c.session_id == session_id)
+    for row in db.session.execute(query.execution_options(yield_per=batch_size)):
+        record = {
+            "type": "message",
+            "session_id": row.session_id,
+            "sender": row.sender.value,
+            "timestamp": _timestamp(row.timestamp),
+            "codec": row.message_codec,
+        }
+        if row.message_codec == CODEC_NONE:
+            record["message"] = row.message or ""
+        else:
+            record["data"] = _b64(row.message_data)
+        yield _line(record)
+
+
+def _export_documents() -> Iterator[str]:
+    query = select(
+        _documents.c.id,
+        _documents.c.filename,
+        _documents.c.mime_type,
+        _documents.c.size_bytes,
+        _documents.c.checksum,
+        _documents.c.storage_data,
+        _documents.c.storage_codec,
+        _documents.c.created_at,
+        _documents.c.minhash,
+        _documents.c.near_duplicate_of_id,
+        _documents.c.duplicate_similarity,
+        _documents.c.duplicate_status,
+    ).order_by(_documents.c.id)
+    for row in db.session.execute(query.execution_options(yield_per=DOCUMENT_BATCH_SIZE)):
+        yield _line({
+            "type": "document",
+            "id": row.id,
+            "filename": row.filename,
+            "mime_type": row.mime_type,
+            "size_bytes": row.size_bytes,
+            "checksum": row.checksum,
+            "created_at": _timestamp(row.created_at),
+            "codec": row.storage_codec,
+            "data": _b64(row.storage_data),
+            "minhash": _b64(row.minhash),
+            "near_duplicate_of": row.near_duplicate_of_id,
+            "duplicate_similarity": row.duplicate_similarity,
+            "duplicate_status": row.duplicate_status,
+        })
+
+
+def import_records(
+    lines: Iterable[bytes],
+    batch_size: int = MESSAGE_BATCH_SIZE,
+    skip_messages: int = 0,
+    skip_documents: int = 0,
+) -> Dict[str, int]:
+    """Insert exported records, committing one batch at a time.
+
+    Messages are written with one ``executemany`` per ``batch_size`` rows and
+    documents ``DOCUMENT_BATCH_SIZE`` at a time. Documents get new ids;
+    near-duplicate links are remapped and LSH bands rebuilt from the exported
+    signatures. Every document payload is checked against its size and
+    checksum. Messages for a session that already exists in the database are
+    rejected (409) rather than merged into it. On error the current batch is
+    rolled back and the counts already committed are attached to the raised
+    ``DataTransferError``.
+
+    To resume an interrupted import, pass those counts (plus any skipped in
+    earlier attempts) as ``skip_messages``/``skip_documents``: that many
+    leading records of each type are taken as already imported.
+    """
+
+    importer = _Importer(batch_size, skip_messages, skip_documents)
+    try:
+        for line_number, raw_line in enumerate(lines, start=1):
+            line = raw_line.strip()
+            if line:
+                importer.add(line, line_number)
+        importer.flush()
+    except DataTransferError as exc:
+        db.session.rollback()
+        exc.imported = dict(importer.counts)
+        raise
+    except BaseException:
+        db.session.rollback()
+        raise
+    return importer.counts
+
+
+class _Importer:
+    def __init__(self, batch_size: int, skip_messages: int = 0, skip_documents: int = 0):
+        self.batch_size = batch_size
+        self.counts = {"messages": 0, "documents": 0}
+        self._skip_messages = skip_messages
+        self._skip_documents = skip_documents
+        self._sessions: Set[str] = set()  # sessions this import created (or resumes)
+        self._messages: List[Dict[str, Any]] = []
+        self._documents: List[Dict[str, Any]] = []
+        self._signatures: List[Optional[bytes]] = []
+        self._pending_ids: List[Optional[int]] = []
+        self._id_map: Dict[int, int] = {}  # exported id -> new id, for near-duplicate links
+
+    def add(self, line: bytes, line_number: int) -> None:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise DataTransferError(f"line {line_number}: invalid JSON")
+        if not isinstance(record, dict):
+            raise DataTransferError(f"line {line_number}: JSON object expected")
+        kind = record.get("type")
+        try:
+            if kind == "header":
+                _check_header(record)
+            elif kind == "message" and self._skip_messages > 0:
+                self._skip_messages -= 1
+                self._sessions.add(record.get("session_id"))
+            elif kind == "message":
+                self._messages.append(_message_row(record))
+                if len(self._messages) >= self.batch_size:
+                    self._flush_messages()
+            elif kind == "document" and self._skip_documents > 0:
+                self._skip_documents -= 1
+                self._map_skipped_document(record)
+            elif kind == "document":
+                self._add_document(record)
+            else:
+                raise DataTransferError(f"unknown record type {kind!r}")
+        except DataTransferError as exc:
+            raise DataTransferError(f"line {line_number}: {exc}", exc.status_code) from None
+        except (KeyError, TypeError, ValueError, CompressionError) as exc:
+            raise DataTransferError(f"line {line_number}: invalid {kind} record ({exc})") from None
+
+    def flush(self) -> None:
+        self._flush_messages()
+        self._flush_documents()
+
+    def _flush_messages(self) -> None:
+        if not self._messages:
+            return
+        new_sessions = {row["session_id"] for row in self._messages} - self._sessions
+        if new_sessions:
+            taken = db.session.execute(
+                select(_messages.c.session_id).where(_messages.c.session_id.in_(new_sessions)).limit(1)
+            ).scalar()
+            if taken is not None:
+                raise DataTransferError(f"session {taken} already exists", 409)
+            self._sessions |= new_sessions
+        db.session.execute(insert(_messages), self._messages)
+        db.session.commit()
+        self.counts["messages"] += len(self._messages)
+        self._messages = []
+
+    def _add_document(self, record: Dict[str, Any]) -> None:
+        row, signature = _document_row(record)
+        original = record.get("near_duplicate_of")
+        if original is not None and original in self._pending_ids:
+            self._flush_documents()  # the original needs its new id first
+        row["near_duplicate_of_id"] = self._id_map.get(original) if original is not None else None
+        if row["near_duplicate_of_id"] is None:
+            row["duplicate_similarity"] = row["duplicate_status"] = None
+        self._documents.append(row)
+        self._signatures.append(signature)
+        self._pending_ids.append(record.get("id"))
+        if len(self._documents) >= DOCUMENT_BATCH_SIZE:
+            self._flush_documents()
+
+    def _map_skipped_document(self, record: Dict[str, Any]) -> None:
+        """Find the row an earlier attempt created, so later near-duplicate links still resolve."""
+
+        if record.get("id") is None or not record.get("checksum"):
+            return
+        new_id = db.session.execute(
+            select(_documents.c.id)
+            .where(_documents.c.checksum == record["checksum"], _documents.c.filename == record.get("filename"))
+            .order_by(_documents.c.id.desc())
+            .limit(1)
+        ).scalar()
+        if new_id is not None:
+            self._id_map[record["id"]] = new_id
+
+    def _flush_documents(self) -> None:
+        if not self._documents:
+            return
+        new_ids = db.session.execute(
+            insert(_documents).returning(_documents.c.id, sort_by_parameter_order=True), self._documents
+        ).scalars().all()
+        bands = [
+            {"document_id": new_id, "band_key": key}
+            for new_id, row, signature in zip(new_ids, self._documents, self._signatures)
+            if signature is not None and row["duplicate_status"] != STATUS_LINKED
+            for key in band_keys(signature_from_bytes(signature))
+        ]
+        if bands:
+            db.session.execute(insert(_bands), bands)
+        bump_index_generation()
+        db.session.commit()
+        for old_id, new_id in zip(self._pending_ids, new_ids):
+            if old_id is not None:
+                self._id_map[old_id] = new_id
+        self.counts["documents"] += len(self._documents)
+        self._documents, self._signatures, self._pending_ids = [], [], []
+
+
+def _check_header(record: Dict[str, Any]) -> None:
+    if record.get("format") != EXPORT_FORMAT:
+        raise DataTransferError(f"not a {EXPORT_FORMAT} file")
+    if not isinstance(record.get("version"), int) or record["version"] > EXPORT_VERSION:
+        raise DataTransferError(f"unsupported export version {record.get('version')!r}")
+
+
+def _parse_timestamp(value: Any) -> datetime:
+    if not isinstance(value, str):
+        raise DataTransferError("timestamp is required")
+    return datetime.fromisoformat(value)
+
+
+def _decode_payload(record: Dict[str, Any]) -> Tuple[bytes, str, bytes]:
+    """Return ``(stored, codec, raw)``; decoding also proves the codec is usable here."""
+
+    codec = record.get("codec") or CODEC_NONE
+    try:
+        stored = base64.b64decode(record["data"], validate=True)
+    except binascii.Error:
+        raise DataTransferError("data is not valid base64")
+    return stored, codec, decompress(stored, codec)
+
+
+def _message_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    session_id = record.get("session_id")
+    if not isinstance(session_id, str) or not session_id or len(session_id) > 36:
+        raise DataTransferError("session_id must be a string of 1-36 characters")
+    row = {
+        "session_id": session_id,
+        "sender": Sender(record.get("sender")),
+        "timestamp": _parse_timestamp(record.get("timestamp")),
+    }
+    if (record.get("codec") or CODEC_NONE) == CODEC_NONE:
+        if not isinstance(record.get("message"), str):
+            raise DataTransferError("message is required")
+        row.update(message=record["message"], message_data=None, message_codec=CODEC_NONE)
+    else:
+        stored, codec, raw = _decode_payload(record)
+        raw.decode("utf-8")
+        row.update(message=None, message_data=stored, message_codec=codec)
+    return row
+
+
+def _document_row(record: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    filename = record.get("filename")
+    if not isinstance(filename, str) or not filename:
+        raise DataTransferError("filename is required")
+    stored, codec, raw = _decode_payload(record)
+    if len(raw) != record.get("size_bytes"):
+        raise DataTransferError("size_bytes does not match the payload")
+    checksum = record.get("checksum")
+    if checksum is not None and hashlib.sha256(raw).hexdigest() != checksum:
+        raise DataTransferError("checksum does not match the payload")
+
+    signature = None
+    if record.get("minhash"):
+        try:
+            signature = base64.b64decode(record["minhash"], validate=True)
+        except binascii.Error:
+            signature = None
+        if signature is not None and len(signature) != MINHASH_PERMUTATIONS * 4:
+            signature = None  # left for `index-documents` to recompute
+    row = {
+        "filename": filename,
+        "mime_type": record.get("mime_type") or "application/octet-stream",
+        "size_bytes": len(raw),
+        "checksum": checksum,
+        "storage_data": stored,
+        "storage_codec": codec,
+        "created_at": _parse_timestamp(record.get("created_at")),
+        "minhash": signature,
+        "duplicate_similarity": record.get("duplicate_similarity"),
+        "duplicate_status": record.get("duplicate_status"),
+    }
+    return row, signature
+
+
+__all__ = [
+    "DOCUMENT_BATCH_SIZE",
+    "EXPORT_FORMAT",
+    "EXPORT_VERSION",
+    "MESSAGE_BATCH_SIZE",
+    "DataTransferError",
+    "import_records",
+    "iter_export",
+]
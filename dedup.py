@@ -0,0 +1,260 @@
+"""Near-duplicate document detection with MinHash signatures and an LSH index."""
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import zlib
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from document_utils import MAX_DOCUMENT_SIZE_BYTES
+from models import Document, DocumentLSHBand, db
+from text_extraction import TextExtractionError, iter_document_text
+
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5  # words per shingle
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16  # 16 bands x 8 rows: pairs above ~0.7 Jaccard almost always collide
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+# any plain-text upload fits; a .docx can inflate far beyond it and then gets no signature
+MAX_SIGNATURE_TEXT_CHARS = MAX_DOCUMENT_SIZE_BYTES
+
+POLICY_OFF = "off"
+POLICY_FLAG = "flag"
+POLICY_LINK = "link"
+POLICY_REJECT = "reject"
+SUPPORTED_POLICIES = (POLICY_OFF, POLICY_FLAG, POLICY_LINK, POLICY_REJECT)
+
+STATUS_FLAGGED = "flagged"
+STATUS_LINKED = "linked"
+
+_EMPTY_BIN = 0xFFFFFFFF
+_BIN_SHIFT = 32 - (MINHASH_PERMUTATIONS.bit_length() - 1)
+_WORD_RE = re.compile(r"\w+")
+_MAX_CARRIED_WORD_CHARS = 1024  # longer unbroken runs are split at piece boundaries
+
+
+class _TextBudgetExceeded(Exception):
+    pass
+
+
+def _iter_word_batches(pieces: Iterable[str]) -> Iterator[List[str]]:
+    """Lower-cased words of streamed text, a list per piece; a word cut by a piece boundary is rejoined."""
+
+    carry = ""
+    for piece in pieces:
+        text = carry + piece
+        cut = len(text)
+        floor = max(0, cut - _MAX_CARRIED_WORD_CHARS)
+        while cut > floor and (text[cut - 1].isalnum() or text[cut - 1] == "_"):
+            cut -= 1
+        if cut == floor and floor > 0:
+            cut = len(text)
+        carry = text[cut:]
+        yield _WORD_RE.findall(text[:cut].lower())
+    yield _WORD_RE.findall(carry.lower())
+
+
+def _iter_shingle_hash_batches(word_batches: Iterable[List[str]]) -> Iterator[List[int]]:
+    """Hash every ``SHINGLE_SIZE``-word window, carrying the last words over to the next batch."""
+
+    tail: List[str] = []
+    hashed = False
+    for batch in word_batches:
+        words = tail + batch
+        if len(words) >= SHINGLE_SIZE:
+            hashed = True
+            yield [
+                zlib.crc32(" ".join(words[index:index + SHINGLE_SIZE]).encode("utf-8"))
+                for index in range(len(words) - SHINGLE_SIZE + 1)
+            ]
+        tail = words[-(SHINGLE_SIZE - 1):]
+    if tail and not hashed:
+        yield [zlib.crc32(" ".join(tail).encode("utf-8"))]  # the whole text is shorter than one shingle
+
+
+def _limit_chars(pieces: Iterable[str], max_chars: int) -> Iterator[str]:
+    total = 0
+    for piece in pieces:
+        total += len(piece)
+        if total > max_chars:
+            raise _TextBudgetExceeded
+        yield piece
+
+
+def shingle_hashes(text: str) -> set:
+    """Hash the overlapping ``SHINGLE_SIZE``-word shingles of normalized text."""
+
+    return {value for batch in _iter_shingle_hash_batches([_WORD_RE.findall(text.lower())]) for value in batch}
+
+
+def minhash_signature(text: str) -> Optional[array]:
+    """Compute a one-permutation MinHash signature, or ``None`` for empty text.
+
+    A single 32-bit hash is split into ``MINHASH_PERMUTATIONS`` bins by its top
+    bits and the minimum per bin is kept, which approximates independent
+    permutations at the cost of one hash per shingle. Empty bins are filled
+    from the next non-empty bin (rotation densification) so short texts still
+    produce comparable signatures.
+    """
+
+    return _minhash(_iter_shingle_hash_batches([_WORD_RE.findall(text.lower())]))
+
+
+def _minhash(hash_batches: Iterable[List[int]]) -> Optional[array]:
+    # per-bin minimums only, so the shingles never need to be held at once
+    bins = [_EMPTY_BIN] * MINHASH_PERMUTATIONS
+    empty = True
+    for batch in hash_batches:
+        empty = empty and not batch
+        for value in batch:
+            index = value >> _BIN_SHIFT
+            if value < bins[index]:
+                bins[index] = value
+    if empty:
+        return None
+    for index in range(MINHASH_PERMUTATIONS):
+        offset = 1
+        while bins[index] == _EMPTY_BIN:
+            source = bins[(index + offset) % MINHASH_PERMUTATIONS]
+            if source != _EMPTY_BIN:
+                # modulo keeps the value a valid uint32 and never equal to the sentinel
+                bins[index] = (source + offset * 0x9E3779B1) % _EMPTY_BIN
+            offset += 1
+    return array("I", bins)
+
+
+def document_signature(
+    data: bytes, mime_type: str, filename: str, max_chars: int = MAX_SIGNATURE_TEXT_CHARS
+) -> Optional[array]:
+    """Signature of an upload's extracted text; ``None`` if it has no usable text.
+
+    The text is hashed as it is extracted, so it is never held whole, and
+    documents whose text runs past ``max_chars`` get no signature.
+    """
+
+    pieces = iter_document_text(data, mime_type, filename)
+    try:
+        return _minhash(_iter_shingle_hash_batches(_iter_word_batches(_limit_chars(pieces, max_chars))))
+    except TextExtractionError as exc:
+        logger.info("Skipping near-duplicate signature for %s: %s", filename, exc)
+    except _TextBudgetExceeded:
+        logger.info("Skipping near-duplicate signature for %s: text exceeds %d characters", filename, max_chars)
+    finally:
+        pieces.close()
+    return None
+
+
+def signature_to_bytes(signature: array) -> bytes:
+    return signature.tobytes()
+
+
+def signature_from_bytes(data: bytes) -> array:
+    signature = array("I")
+    signature.frombytes(data)
+    return signature
+
+
+def estimate_similarity(first: array, second: array) -> float:
+    """Estimated Jaccard similarity: the share of matching signature slots."""
+
+    matches = sum(1 for left, right in zip(first, second) if left == right)
+    return matches / MINHASH_PERMUTATIONS
+
+
+def band_keys(signature: array) -> List[str]:
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        keys.append(f"{band}:{hashlib.blake2b(rows, digest_size=8).hexdigest()}")
+    return keys
+
+
+def find_near_duplicate(
+    signature: array,
+    checksum: Optional[str],
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+) -> Optional[Tuple[int, float]]:
+    """Return ``(document_id, similarity)`` of the closest indexed match.
+
+    Byte-identical documents are matched by checksum first. Otherwise only
+    documents sharing at least one LSH band with ``signature`` are compared,
+    so the cost depends on the number of candidates, not the corpus size.
+    """
+
+    if checksum:
+        exact = db.session.execute(
+            select(Document.id, Document.near_duplicate_of_id)
+            .where(Document.checksum == checksum)
+            .order_by(Document.id.asc())
+            .limit(1)
+        ).first()
+        if exact is not None:
+            return exact.near_duplicate_of_id or exact.id, 1.0
+    if signature is None:
+        return None
+
+    candidate_ids = db.session.execute(
+        select(DocumentLSHBand.document_id).where(DocumentLSHBand.band_key.in_(band_keys(signature))).distinct()
+    ).scalars().all()
+    if not candidate_ids:
+        return None
+
+    best: Optional[Tuple[int, float]] = None
+    for document_id, raw in db.session.execute(
+        select(Document.id, Document.minhash).where(Document.id.in_(candidate_ids), Document.minhash.is_not(None))
+    ):
+        similarity = estimate_similarity(signature, signature_from_bytes(raw))
+        if similarity >= threshold and (best is None or similarity > best[1]):
+            best = (document_id, similarity)
+    return best
+
+
+def index_signature(document: Document, signature: array) -> None:
+    """Attach LSH band rows so later uploads can find ``document``."""
+
+    document.lsh_bands = [DocumentLSHBand(band_key=key) for key in band_keys(signature)]
+
+
+def release_duplicates(original_id: int) -> None:
+    """Detach documents pointing at ``original_id`` before it is deleted.
+
+    Linked copies were kept out of the LSH index; they are indexed now so the
+    content stays discoverable once the original is gone.
+    """
+
+    followers: Iterable[Document] = Document.query.filter_by(near_duplicate_of_id=original_id).all()
+    for follower in followers:
+        if follower.duplicate_status == STATUS_LINKED and follower.minhash is not None:
+            index_signature(follower, signature_from_bytes(follower.minhash))
+        follower.near_duplicate_of_id = None
+        follower.duplicate_similarity = None
+        follower.duplicate_status = None
+
+
+__all__ = [
+    "DEFAULT_SIMILARITY_THRESHOLD",
+    "MAX_SIGNATURE_TEXT_CHARS",
+    "POLICY_FLAG",
+    "POLICY_LINK",
+    "POLICY_OFF",
+    "POLICY_REJECT",
+    "STATUS_FLAGGED",
+    "STATUS_LINKED",
+    "SUPPORTED_POLICIES",
+    "band_keys",
+    "document_signature",
+    "estimate_similarity",
+    "find_near_duplicate",
+    "index_signature",
+    "minhash_signature",
+    "release_duplicates",
+    "signature_from_bytes",
+    "signature_to_bytes",
+]
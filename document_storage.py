@@ -0,0 +1,150 @@
+"""Chunked reads of stored document bytes and the on-disk document cache."""
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import func, select
+
+from compression import CODEC_NONE, iter_decompress
+from models import Document, db
+
+
+DOCUMENT_CHUNK_SIZE = 256 * 1024
+_CHECKSUM_RE = re.compile(r"[0-9a-f]{16,128}")
+
+
+def iter_document_bytes(document: Document, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yield bytes ``start``..``end`` (inclusive) of a document's content.
+
+    Uncompressed blobs are read ``DOCUMENT_CHUNK_SIZE`` bytes at a time with
+    ``substr`` so the full blob never sits in memory. Compressed blobs have to
+    be fetched whole, but are decoded incrementally. Only plain values are
+    captured from ``document``, so the generator can outlive its session
+    (e.g. inside a streamed response).
+    """
+
+    document_id, codec = document.id, document.storage_codec
+    if end is None:
+        end = document.size_bytes - 1
+    return _iter_content(document_id, codec, start, end)
+
+
+def _iter_content(document_id: int, codec: str, start: int, end: int) -> Iterator[bytes]:
+    if codec == CODEC_NONE:
+        yield from _iter_blob_slices(document_id, start, end)
+        return
+    packed = db.session.execute(select(Document.stored_data).where(Document.id == document_id)).scalar()
+    if packed is None:
+        return
+    yield from _slice_chunks(iter_decompress(packed, codec, DOCUMENT_CHUNK_SIZE), start, end)
+
+
+def _iter_blob_slices(document_id: int, start: int, end: int) -> Iterator[bytes]:
+    offset = start
+    while offset <= end:
+        length = min(DOCUMENT_CHUNK_SIZE, end - offset + 1)
+        chunk = db.session.execute(
+            # SQL substr is 1-based
+            select(func.substr(Document.stored_data, offset + 1, length)).where(Document.id == document_id)
+        ).scalar()
+        if not chunk:
+            return  # deleted mid-stream
+        yield bytes(chunk)
+        offset += len(chunk)
+
+
+def _slice_chunks(chunks: Iterable[bytes], start: int, end: int) -> Iterator[bytes]:
+    position = 0
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start:
+            yield chunk[max(start - position, 0):end - position + 1]
+        position = chunk_end
+        if position > end:
+            return
+
+
+def cached_document_path(cache_dir: str, document: Document, max_bytes: int = 0) -> Optional[str]:
+    """Return an on-disk copy of the document, writing it on first use.
+
+    Files are named by checksum, so identical uploads share one copy and a
+    stale file can never be served for different bytes. With ``max_bytes``
+    set, the directory is trimmed after each write by removing the least
+    recently served files (a hit refreshes the file's mtime, which works even
+    on ``noatime`` mounts). Returns ``None`` for documents without a (hex)
+    checksum or larger than ``max_bytes``.
+    """
+
+    if not document.checksum or not _CHECKSUM_RE.fullmatch(document.checksum):
+        return None
+    if max_bytes > 0 and document.size_bytes > max_bytes:
+        return None
+    path = os.path.join(cache_dir, document.checksum)
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=".partial-")
+    try:
+        with os.fdopen(fd, "wb") as cache_file:
+            for chunk in iter_document_bytes(document):
+                cache_file.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    if max_bytes > 0:
+        _trim_cache(cache_dir, max_bytes, keep=document.checksum)
+    return path
+
+
+def _trim_cache(cache_dir: str, max_bytes: int, keep: str) -> None:
+    entries = []
+    total = 0
+    with os.scandir(cache_dir) as listing:
+        for entry in listing:
+            if not _CHECKSUM_RE.fullmatch(entry.name):
+                continue  # in-progress writes and foreign files
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.name))
+            total += stat.st_size
+    # unlinking a file another request is sending is safe: open handles keep it readable
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def evict_cached_document(cache_dir: str, checksum: Optional[str]) -> None:
+    """Drop a cached file once no stored document references its checksum."""
+
+    if not cache_dir or not checksum or not _CHECKSUM_RE.fullmatch(checksum):
+        return
+    if db.session.query(Document.id).filter_by(checksum=checksum).first() is not None:
+        return
+    try:
+        os.remove(os.path.join(cache_dir, checksum))
+    except FileNotFoundError:
+        pass
+
+
+__all__ = [
+    "DOCUMENT_CHUNK_SIZE",
+    "cached_document_path",
+    "evict_cached_document",
+    "iter_document_bytes",
+]
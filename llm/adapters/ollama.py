@@ -2,11 +2,12 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, List
+import time
+from typing import Dict, List, Optional
 
 from ollama import ChatResponse, Client
 
-from llm.base import LLMAdapter, LLMError
+from llm.base import LLMAdapter, LLMError, SpanRecorder
 from models import ChatMessage, Sender
 
 
@@ -25,13 +26,24 @@ class OllamaAdapter(LLMAdapter):
         # TODO: Surface a way to inject custom headers/API keys for remote hosts.
 
     """Call the configured Ollama chat model with full history and returns the response."""
-    def chat(self, messages: List[ChatMessage], stream: bool = False) -> ChatMessage:
+    def chat(
+        self, messages: List[ChatMessage], stream: bool = False, record_span: Optional[SpanRecorder] = None
+    ) -> ChatMessage:
+        started = time.perf_counter()
+        ollama_messages = self._convert_messages(messages)
+        if record_span is not None:
+            record_span("message_conversion", started, time.perf_counter())
         try:
-            response: ChatResponse = self._client.chat(
-                model=self.chat_model,
-                stream=stream,
-                messages=self._convert_messages(messages),
-            )
+            if record_span is None and not stream:
+                response: ChatResponse = self._client.chat(
+                    model=self.chat_model,
+                    stream=False,
+                    messages=ollama_messages,
+                )
+                content = response.message.content
+            else:
+                # streaming lets a timed call split time-to-first-token from generation
+                content = self._chat_streamed(ollama_messages, record_span)
         except Exception as exc:  # pragma: no cover - network/SDK failure
             logger.exception("Ollama chat call failed")
             raise LLMError("Ollama chat call failed") from exc
@@ -40,9 +52,23 @@ class OllamaAdapter(LLMAdapter):
         return ChatMessage(
             session_id=messages[0].session_id if messages else "",
             sender=Sender.ASSISTANT,
-            message=response.message.content,
+            message=content,
         )
 
+    def _chat_streamed(self, ollama_messages: List[Dict[str, str]], record_span: Optional[SpanRecorder]) -> str:
+        started = time.perf_counter()
+        first_token = None
+        parts = []
+        for chunk in self._client.chat(model=self.chat_model, stream=True, messages=ollama_messages):
+            if first_token is None:
+                first_token = time.perf_counter()
+            parts.append(chunk.message.content or "")
+        finished = time.perf_counter()
+        if record_span is not None:
+            record_span("llm_ttft", started, first_token or finished)
+            record_span("llm_generation", first_token or finished, finished)
+        return "".join(parts)
+
     def embed(self, texts: List[str]) -> List[List[float]]:
         # TODO: Call embedding endpoint once the RAG pipeline is ready.
         raise NotImplementedError("embed not implemented yet")
@@ -2,10 +2,14 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, List, Optional
 from models import ChatMessage
 
 
+SpanRecorder = Callable[[str, float, float], None]
+"""Receives ``(name, start, end)`` ``time.perf_counter`` readings for a step of an LLM call."""
+
+
 class LLMError(Exception):
     """Represents failures raised by any LLM adapter."""
 
@@ -15,8 +19,8 @@ class LLMAdapter(ABC):
     """Defines the expected LLM operations for adapters."""
 
     @abstractmethod
-    def chat(self, messages: List[ChatMessage]) -> ChatMessage:
-        """Execute a chat completion request."""
+    def chat(self, messages: List[ChatMessage], record_span: Optional[SpanRecorder] = None) -> ChatMessage:
+        """Execute a chat completion request, reporting step timings to ``record_span`` if given."""
 
     @abstractmethod
     def embed(self, texts: List[str]) -> List[List[float]]:
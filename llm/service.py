@@ -1,23 +1,63 @@
 """High-level LLM service that delegates to provider adapters."""
 from __future__ import annotations
 
-from typing import List
+import threading
+from typing import Callable, List, Optional
 
-from llm.base import LLMAdapter
+from llm.base import LLMAdapter, LLMError, SpanRecorder
 from models import ChatMessage
 
 
 class LLMService:
-    """Routes LLM requests to the configured adapter."""
-
-    def __init__(self, adapter: LLMAdapter):
+    """Routes LLM requests to the configured adapter.
+
+    Pass ``adapter_factory`` instead of ``adapter`` to defer building the
+    adapter (and importing its SDK) until the first LLM call. Factory failures
+    (bad config, missing SDK) surface as ``LLMError`` from that call and the
+    build is retried on the next one.
+    """
+
+    def __init__(
+        self,
+        adapter: Optional[LLMAdapter] = None,
+        adapter_factory: Optional[Callable[[], LLMAdapter]] = None,
+    ):
+        if adapter is None and adapter_factory is None:
+            raise ValueError("adapter or adapter_factory is required")
         self._adapter = adapter
+        self._adapter_factory = adapter_factory
+        self._lock = threading.Lock()
+
+    @property
+    def adapter(self) -> LLMAdapter:
+        adapter = self._adapter
+        if adapter is None:
+            with self._lock:
+                if self._adapter is None:
+                    try:
+                        self._adapter = self._adapter_factory()
+                    except (ImportError, KeyError, OSError, RuntimeError, ValueError) as exc:
+                        raise LLMError(f"LLM adapter unavailable: {exc}") from exc
+                adapter = self._adapter
+        return adapter
+
+    def chat(self, messages: List[ChatMessage], record_span: Optional[SpanRecorder] = None) -> ChatMessage:
+        if record_span is None:
+            return self.adapter.chat(messages)
+        return self.adapter.chat(messages, record_span=record_span)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.adapter.embed(texts)
 
-    def chat(self, messages: List[ChatMessage]) -> ChatMessage:
-        return self._adapter.chat(messages)
+    def set_adapter(self, adapter: LLMAdapter) -> None:
+        # waits for an in-progress lazy build, which would otherwise overwrite ``adapter`` when it finishes
+        with self._lock:
+            self._adapter = adapter
 
-    def embed(self, texts: List[str]) -> List[List[float]]: 
-        return self._adapter.embed(texts)
+    def reset_adapter(self) -> None:
+        """Drop the current adapter so the factory builds a fresh one on the next call."""
 
-    def set_adapter(self, adapter: LLMAdapter) -> None:
-        self._adapter = adapter
+        if self._adapter_factory is None:
+            raise ValueError("reset_adapter needs an adapter_factory")
+        with self._lock:
+            self._adapter = None
@@ -1,54 +1,206 @@
 from __future__ import annotations
 
+import json
 import os
+import unicodedata
 import uuid
-
-from dotenv import load_dotenv
-from flask import Flask, jsonify, request
-from flask_migrate import Migrate
-from sqlalchemy import inspect
-from sqlalchemy.exc import SQLAlchemyError
-
-from config_loader import LLMConfig
+import weakref
+from dataclasses import asdict, dataclass
+from datetime import timezone
+from itertools import chain
+from typing import Iterable, Iterator
+from urllib.parse import quote
+
+import click
+from flask import Blueprint, Flask, current_app, jsonify, request, send_file, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import delete, inspect, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import undefer
+
+import compression
+from active_model import ActiveModelTracker, publish_active_model
+from batch_jobs import BatchJobError, BatchJobRunner, input_path, results_path, spool_batch_input
+from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, Chunk, iter_document_chunks
+from config_loader import ConfigWatcher, LLMConfig
+from data_transfer import DOCUMENT_BATCH_SIZE, MESSAGE_BATCH_SIZE, DataTransferError, import_records, iter_export
+from dedup import (
+    POLICY_LINK,
+    POLICY_OFF,
+    POLICY_REJECT,
+    STATUS_FLAGGED,
+    STATUS_LINKED,
+    SUPPORTED_POLICIES,
+    document_signature,
+    find_near_duplicate,
+    index_signature,
+    release_duplicates,
+    signature_to_bytes,
+)
+from document_storage import cached_document_path, evict_cached_document, iter_document_bytes
 from document_utils import (
     DocumentUploadError,
     extract_upload_from_request,
     prepare_document_payload,
 )
-from llm.adapters.ollama import OllamaAdapter
-from llm.base import LLMError
+from llm.base import LLMAdapter, LLMError
 from llm.service import LLMService
-from models import AppConfig, ChatMessage, Document, Sender, db
+from models import AppConfig, BatchJob, ChatMessage, Document, Sender, db
+from profiling import current_trace, init_profiling, trace_span
+from retrieval_cache import RetrievalCache, bump_index_generation, current_index_generation
+from text_extraction import TextExtractionError
 
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DEFAULT_DB_PATH = os.path.join(BASE_DIR, "lockno.db")
 
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DEFAULT_DB_PATH}")
-CONFIG_PATH = os.getenv("LOCKNO_CONFIG", os.path.join(BASE_DIR, "config.json"))
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+DOCUMENT_MAX_AGE_SECONDS = 3600
+
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful personal assistant. Answer the user's questions as best as you can. "
+    "If you don't know the answer just say you don't know. You will be provided with personalized context from RAG techniques. "
+    "Use that context to help yourself create better answers, and always prefer that context over your own knowledge. "
+    "Be realistic and not too sugar coated in the way you answer questions."
+)
+
+api = Blueprint("api", __name__)
+
+
+@dataclass
+class AppServices:
+    config_watcher: ConfigWatcher
+    llm_service: LLMService
+    active_model: ActiveModelTracker
+    batch_runner: BatchJobRunner
+    retrieval_cache: RetrievalCache
+
+
+def create_app(test_config: dict | None = None) -> Flask:
+    """Build the Flask app without touching the database or the LLM provider.
+
+    The config file is parsed and the provider adapter (and its SDK) imported
+    on first use, so importing this module and running CLI/migration commands
+    stays cheap. Seed the config table with ``flask --app main seed-config``.
+
+    Nothing here opens connections or starts threads, so the app can be
+    preloaded by a pre-fork server (``gunicorn --preload``); the active model
+    is shared between the forked workers through the ``active_model`` row.
+    """
+    from dotenv import load_dotenv
+    from flask_migrate import Migrate
+
+    load_dotenv()
+    app = Flask(__name__)
+    app.config.from_mapping(
+        SQLALCHEMY_DATABASE_URI=os.getenv("DATABASE_URL", f"sqlite:///{DEFAULT_DB_PATH}"),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        LOCKNO_CONFIG=os.getenv("LOCKNO_CONFIG", os.path.join(BASE_DIR, "config.json")),
+        LOCKNO_CONFIG_RELOAD_SECONDS=float(os.getenv("LOCKNO_CONFIG_RELOAD_SECONDS", "2")),
+        OLLAMA_BASE_URL=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+        LOCKNO_BATCH_DIR=os.getenv("LOCKNO_BATCH_DIR", os.path.join(BASE_DIR, "batch_jobs")),
+        LOCKNO_BATCH_WORKERS=int(os.getenv("LOCKNO_BATCH_WORKERS", "2")),
+        LOCKNO_BATCH_LEASE_SECONDS=float(os.getenv("LOCKNO_BATCH_LEASE_SECONDS", "60")),
+        LOCKNO_BATCH_POLL_SECONDS=float(os.getenv("LOCKNO_BATCH_POLL_SECONDS", "5")),
+        LOCKNO_PROFILE_HEADER=os.getenv("LOCKNO_PROFILE_HEADER", "X-LockNo-Profile"),
+        LOCKNO_PROFILE_TOKEN=os.getenv("LOCKNO_PROFILE_TOKEN", ""),
+        LOCKNO_PROFILE_SAMPLE_RATE=float(os.getenv("LOCKNO_PROFILE_SAMPLE_RATE", "0")),
+        LOCKNO_PROFILE_DIR=os.getenv("LOCKNO_PROFILE_DIR", ""),
+        LOCKNO_PROFILE_MAX_REPORTS=int(os.getenv("LOCKNO_PROFILE_MAX_REPORTS", "500")),
+        LOCKNO_COMPRESSION=os.getenv("LOCKNO_COMPRESSION", compression.CODEC_NONE),
+        LOCKNO_ACTIVE_MODEL_POLL_SECONDS=float(os.getenv("LOCKNO_ACTIVE_MODEL_POLL_SECONDS", "1")),
+        LOCKNO_DOCUMENT_CACHE_DIR=os.getenv("LOCKNO_DOCUMENT_CACHE_DIR", ""),
+        LOCKNO_DOCUMENT_CACHE_MB=float(os.getenv("LOCKNO_DOCUMENT_CACHE_MB", "1024")),
+        LOCKNO_NEAR_DUPLICATE_POLICY=os.getenv("LOCKNO_NEAR_DUPLICATE_POLICY", "flag"),
+        LOCKNO_NEAR_DUPLICATE_THRESHOLD=float(os.getenv("LOCKNO_NEAR_DUPLICATE_THRESHOLD", "0.8")),
+        LOCKNO_CHUNK_TOKENS=int(os.getenv("LOCKNO_CHUNK_TOKENS", str(DEFAULT_CHUNK_TOKENS))),
+        LOCKNO_CHUNK_OVERLAP_TOKENS=int(os.getenv("LOCKNO_CHUNK_OVERLAP_TOKENS", str(DEFAULT_OVERLAP_TOKENS))),
+        LOCKNO_RETRIEVAL_CACHE_ENTRIES=int(os.getenv("LOCKNO_RETRIEVAL_CACHE_ENTRIES", "1024")),
+        LOCKNO_RETRIEVAL_CACHE_MB=float(os.getenv("LOCKNO_RETRIEVAL_CACHE_MB", "32")),
+    )
+    if test_config:
+        app.config.from_mapping(test_config)
+
+    compression.configure(app.config["LOCKNO_COMPRESSION"])
+    if app.config["LOCKNO_NEAR_DUPLICATE_POLICY"] not in SUPPORTED_POLICIES:
+        raise RuntimeError(f"Unsupported near-duplicate policy: {app.config['LOCKNO_NEAR_DUPLICATE_POLICY']}")
+
+    db.init_app(app)
+    Migrate(app, db)
+    _forkable_apps.add(app)
+
+    config_watcher = ConfigWatcher(app.config["LOCKNO_CONFIG"], interval=app.config["LOCKNO_CONFIG_RELOAD_SECONDS"])
+    ollama_base_url = app.config["OLLAMA_BASE_URL"]
+    llm_service = LLMService(adapter_factory=lambda: create_adapter(config_watcher.current(), ollama_base_url))
+    active_model = ActiveModelTracker(
+        llm_service,
+        build_adapter=lambda provider, model_name, embedding_model: create_adapter(
+            config_watcher.current(), ollama_base_url, provider, model_name, embedding_model
+        ),
+        interval=app.config["LOCKNO_ACTIVE_MODEL_POLL_SECONDS"],
+    )
+    app.extensions["lockno"] = AppServices(
+        config_watcher=config_watcher,
+        llm_service=llm_service,
+        active_model=active_model,
+        batch_runner=BatchJobRunner(
+            app=app,
+            service=llm_service,
+            batch_dir=app.config["LOCKNO_BATCH_DIR"],
+            system_prompt=DEFAULT_SYSTEM_PROMPT,
+            max_workers=app.config["LOCKNO_BATCH_WORKERS"],
+            on_progress=active_model.sync,
+            lease_seconds=app.config["LOCKNO_BATCH_LEASE_SECONDS"],
+            poll_seconds=app.config["LOCKNO_BATCH_POLL_SECONDS"],
+        ),
+        retrieval_cache=RetrievalCache(
+            max_entries=app.config["LOCKNO_RETRIEVAL_CACHE_ENTRIES"],
+            max_bytes=int(app.config["LOCKNO_RETRIEVAL_CACHE_MB"] * 1024 * 1024),
+        ),
+    )
+
+    init_profiling(app)
+    app.register_blueprint(api)
+    app.cli.add_command(seed_config_command)
+    app.cli.add_command(compress_payloads_command)
+    app.cli.add_command(index_documents_command)
+    app.cli.add_command(export_data_command)
+    app.cli.add_command(import_data_command)
+    app.cli.add_command(recover_batches_command)
+    return app
+
+
+def _services() -> AppServices:
+    return current_app.extensions["lockno"]
+
+
+def _dispose_engines(app: Flask) -> None:
+    # pooled connections inherited from the parent must not be shared with it
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
 
-llm_config = LLMConfig(CONFIG_PATH)
-PROVIDER_CONFIG = llm_config.providers
-DEFAULT_PROVIDER = llm_config.default_provider
-DEFAULT_MODEL_FOR_PROVIDER, DEFAULT_EMBEDDING_FOR_PROVIDER = llm_config.provider_defaults(DEFAULT_PROVIDER)
 
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# one fork hook for the process; apps are held weakly so discarded ones can be collected
+_forkable_apps: "weakref.WeakSet[Flask]" = weakref.WeakSet()
 
-db.init_app(app)
-migrate = Migrate(app, db)
+
+def _dispose_engines_after_fork() -> None:
+    for app in list(_forkable_apps):
+        _dispose_engines(app)
+
+
+os.register_at_fork(after_in_child=_dispose_engines_after_fork)
 
 
 def create_adapter(
-    provider: str = DEFAULT_PROVIDER,
-    model_name: str = DEFAULT_MODEL_FOR_PROVIDER,
-    embedding_model: str = DEFAULT_EMBEDDING_FOR_PROVIDER,
-):
-    provider_key = provider.strip().lower()
-    provider_cfg = PROVIDER_CONFIG.get(provider_key)
+    llm_config: LLMConfig,
+    ollama_base_url: str,
+    provider: str = "",
+    model_name: str = "",
+    embedding_model: str = "",
+) -> LLMAdapter:
+    provider_key = (provider or llm_config.default_provider).strip().lower()
+    provider_cfg = llm_config.providers.get(provider_key)
     if provider_cfg is None:
         raise RuntimeError(f"Provider '{provider_key}' missing from config")
 
@@ -61,8 +213,11 @@ def create_adapter(
         if not resolved_model:
             raise RuntimeError("Ollama model missing in config")
         resolved_embedding = (embedding_model or resolved_model).strip()
+        # imported here so the SDK is only loaded once an Ollama adapter is needed
+        from llm.adapters.ollama import OllamaAdapter
+
         adapter = OllamaAdapter(
-            base_url=OLLAMA_BASE_URL,
+            base_url=ollama_base_url,
             chat_model=resolved_model,
             embedding_model=resolved_embedding,
         )
@@ -71,57 +226,229 @@ def create_adapter(
     raise RuntimeError(f"Unsupported LLM provider: {provider_key}")
 
 
-llm_service = LLMService(
-    adapter=create_adapter(DEFAULT_PROVIDER, DEFAULT_MODEL_FOR_PROVIDER, DEFAULT_EMBEDDING_FOR_PROVIDER)
-)
+def sync_config_table(llm_config: LLMConfig | None = None) -> None:
+    """Bring the config table in line with the JSON definition.
 
-def reset_config_table() -> None:
-    """Replace config table contents to match the JSON definition."""
+    Only rows that disappeared from the file are deleted and only new ones are
+    inserted, so an unchanged config touches nothing.
+    """
+    llm_config = llm_config or _services().config_watcher.current()
     try:
-        db.session.query(AppConfig).delete()
-        for row in _iter_config_rows():
-            db.session.add(row)
+        existing = {
+            (row.provider, row.model_name, row.model_type): row.id
+            for row in db.session.execute(
+                select(AppConfig.id, AppConfig.provider, AppConfig.model_name, AppConfig.model_type)
+            )
+        }
+        wanted = llm_config.model_keys()
+        stale_ids = [row_id for key, row_id in existing.items() if key not in wanted]
+        missing = [key for key in wanted if key not in existing]
+        if not stale_ids and not missing:
+            return
+        if stale_ids:
+            db.session.execute(delete(AppConfig).where(AppConfig.id.in_(stale_ids)))
+        db.session.add_all(
+            AppConfig(provider=provider, model_name=model_name, model_type=model_type)
+            for provider, model_name, model_type in missing
+        )
         db.session.commit()
+        current_app.logger.info("Config table synced: %d added, %d removed", len(missing), len(stale_ids))
+    except IntegrityError:
+        # another worker applied the same change first
+        db.session.rollback()
     except SQLAlchemyError as exc:
         db.session.rollback()
-        app.logger.warning("Failed to seed config table: %s", exc)
+        current_app.logger.warning("Failed to sync config table: %s", exc)
+
+
+@click.command("seed-config")
+@with_appcontext
+def seed_config_command() -> None:
+    """Sync the app_config table with the JSON config file."""
+    if not inspect(db.engine).has_table(AppConfig.__tablename__):
+        raise click.ClickException("app_config table missing; run `flask --app main db upgrade` first")
+    sync_config_table()
+    click.echo("Config table synced.")
+
+
+def recompress_payloads(model, codec_attr: str, rewrite, codec: str, batch_size: int, options=()) -> int:
+    """Re-encode rows of ``model`` not yet stored with ``codec``, one batch per commit.
+
+    Rows are walked in primary-key order so each run is a single pass even
+    when some payloads end up uncompressed because they would not shrink.
+    ``options`` are applied to the batch query, e.g. to undefer the payload.
+    """
+    codec_column = getattr(model, codec_attr)
+    converted = 0
+    last_id = 0
+    while True:
+        rows = (
+            model.query.options(*options)
+            .filter(model.id > last_id, codec_column != codec)
+            .order_by(model.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return converted
+        for row in rows:
+            previous = getattr(row, codec_attr)
+            rewrite(row, codec)
+            if getattr(row, codec_attr) != previous:
+                converted += 1
+        last_id = rows[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+
+@click.command("compress-payloads")
+@click.option("--codec", type=click.Choice(compression.SUPPORTED_CODECS), default=None,
+              help="Target codec; defaults to LOCKNO_COMPRESSION.")
+@click.option("--batch-size", type=int, default=200, show_default=True, help="Messages per commit.")
+@click.option("--document-batch-size", type=int, default=DOCUMENT_BATCH_SIZE, show_default=True,
+              help="Documents per commit; each can hold up to 15 MB.")
+@with_appcontext
+def compress_payloads_command(codec: str | None, batch_size: int, document_batch_size: int) -> None:
+    """Rewrite stored messages and documents with the target codec."""
+    codec = codec or current_app.config["LOCKNO_COMPRESSION"]
+    try:
+        messages = recompress_payloads(
+            ChatMessage, "message_codec", lambda row, c: row.set_message(row.message, c), codec, batch_size
+        )
+        documents = recompress_payloads(
+            Document,
+            "storage_codec",
+            lambda row, c: row.set_storage_data(row.storage_data, c),
+            codec,
+            document_batch_size,
+            options=(undefer(Document.stored_data),),
+        )
+    except (SQLAlchemyError, compression.CompressionError) as exc:
+        db.session.rollback()
+        raise click.ClickException(str(exc))
+    click.echo(f"Re-encoded {messages} messages and {documents} documents with '{codec}'.")
 
 
-def _iter_config_rows():
-    for entry in llm_config.iter_models():
-        yield AppConfig(
-            provider=entry.provider,
-            model_name=entry.name,
-            model_type=entry.model_type,
-        )
+@click.command("index-documents")
+@click.option("--batch-size", type=int, default=50, show_default=True)
+@with_appcontext
+def index_documents_command(batch_size: int) -> None:
+    """Compute MinHash signatures for documents stored before near-duplicate detection."""
+    indexed = 0
+    last_id = 0
+    try:
+        while True:
+            documents = (
+                Document.query.filter(Document.id > last_id, Document.minhash.is_(None))
+                .order_by(Document.id.asc())
+                .limit(batch_size)
+                .all()
+            )
+            if not documents:
+                break
+            for document in documents:
+                signature = document_signature(document.storage_data, document.mime_type, document.filename)
+                if signature is None:
+                    continue
+                document.minhash = signature_to_bytes(signature)
+                if document.duplicate_status != STATUS_LINKED:
+                    index_signature(document, signature)
+                indexed += 1
+            last_id = documents[-1].id
+            db.session.commit()
+            db.session.expunge_all()
+    except SQLAlchemyError as exc:
+        db.session.rollback()
+        raise click.ClickException(str(exc))
+    click.echo(f"Indexed {indexed} documents.")
 
 
-def ensure_config_seeded() -> None:
+@click.command("recover-batches")
+@click.option("--resume", is_flag=True, help="Finish interrupted jobs in the foreground instead of failing them.")
+@with_appcontext
+def recover_batches_command(resume: bool) -> None:
+    """Settle batch jobs whose worker stopped, for when no server will reclaim them."""
     try:
-        inspector = inspect(db.engine)
-        if not inspector.has_table(AppConfig.__tablename__):
-            return
-        if db.session.query(AppConfig).count() == 0:
-            reset_config_table()
-    except SQLAlchemyError:
+        resumed, failed = _services().batch_runner.recover(resume)
+    except (OSError, SQLAlchemyError) as exc:
         db.session.rollback()
+        raise click.ClickException(str(exc))
+    click.echo(f"Resumed {resumed} and failed {failed} interrupted batch jobs.")
+
+
+@click.command("export-data")
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-", show_default=True)
+@click.option("--session", "session_id", default=None, help="Export a single chat session (messages only).")
+@click.option("--no-messages", is_flag=True, help="Skip chat messages.")
+@click.option("--no-documents", is_flag=True, help="Skip documents.")
+@with_appcontext
+def export_data_command(output, session_id: str | None, no_messages: bool, no_documents: bool) -> None:
+    """Stream chat messages and documents as NDJSON."""
+    try:
+        for line in iter_export(not no_messages, not no_documents, session_id):
+            output.write(line)
+    except SQLAlchemyError as exc:
+        raise click.ClickException(str(exc))
+
+
+@click.command("import-data")
+@click.argument("source", type=click.File("rb"), default="-")
+@click.option("--batch-size", type=int, default=MESSAGE_BATCH_SIZE, show_default=True)
+@click.option("--skip-messages", type=int, default=0, help="Resume: messages already imported by an earlier run.")
+@click.option("--skip-documents", type=int, default=0, help="Resume: documents already imported by an earlier run.")
+@with_appcontext
+def import_data_command(source, batch_size: int, skip_messages: int, skip_documents: int) -> None:
+    """Load an NDJSON file written by export-data."""
+    try:
+        counts = import_records(source, batch_size, skip_messages, skip_documents)
+    except DataTransferError as exc:
+        raise click.ClickException(
+            f"{exc} (already committed: {exc.imported['messages']} messages, {exc.imported['documents']} documents;"
+            f" resume with --skip-messages {skip_messages + exc.imported['messages']}"
+            f" --skip-documents {skip_documents + exc.imported['documents']})"
+        )
+    except SQLAlchemyError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f"Imported {counts['messages']} messages and {counts['documents']} documents.")
+
 
-@app.post("/api/chat")
+@api.before_app_request
+def reload_config_if_changed() -> None:
+    services = _services()
+    previous = services.config_watcher.loaded
+    llm_config = services.config_watcher.refresh()
+    if llm_config is not None:
+        sync_config_table(llm_config)
+        services.active_model.config_reloaded(previous, llm_config)
+
+
+@api.before_app_request
+def sync_active_model() -> None:
+    _services().active_model.sync()
+
+
+@api.before_app_request
+def start_batch_dispatcher() -> None:
+    _services().batch_runner.start()
+
+@api.post("/api/chat")
 def send_chat_message():
-    body = request.get_json(silent=False)
-    if body is None or not isinstance(body, dict):
-        return jsonify({"error": "JSON body is required"}), 400
+    with trace_span("request_parse"):
+        body = request.get_json(silent=False)
+        if body is None or not isinstance(body, dict):
+            return jsonify({"error": "JSON body is required"}), 400
 
-    raw_session = body.get("session_id")
-    session_id = raw_session.strip() if isinstance(raw_session, str) else ""
-    raw_message = body.get("message")
-    message = raw_message.strip() if isinstance(raw_message, str) else ""
+        raw_session = body.get("session_id")
+        session_id = raw_session.strip() if isinstance(raw_session, str) else ""
+        raw_message = body.get("message")
+        message = raw_message.strip() if isinstance(raw_message, str) else ""
 
     if not message:
         return jsonify({"error": "message is required"}), 400
 
     if session_id:
-        existing = ChatMessage.query.filter_by(session_id=session_id).first()
+        with trace_span("session_lookup"):
+            existing = ChatMessage.query.filter_by(session_id=session_id).first()
         if not existing:
             return jsonify({"error": "session not found"}), 404
     else:
@@ -129,35 +456,37 @@ def send_chat_message():
         system_prompt = ChatMessage(
             session_id=session_id,
             sender=Sender.SYSTEM,
-            message=(
-                "You are a helpful personal assistant. Answer the user's questions as best as you can. "
-                "If you don't know the answer just say you don't know. You will be provided with personalized context from RAG techniques. "
-                "Use that context to help yourself create better answers, and always prefer that context over your own knowledge. "
-                "Be realistic and not too sugar coated in the way you answer questions."
-            ),
+            message=DEFAULT_SYSTEM_PROMPT,
         )
         try:
-            db.session.add(system_prompt)
-            db.session.commit()
+            with trace_span("session_create"):
+                db.session.add(system_prompt)
+                db.session.commit()
         except SQLAlchemyError as exc:
             db.session.rollback()
             return jsonify({"error": "failed to create session", "details": str(exc)}), 500
 
     # retrieve and package the full session chat history and send to LLM 
-    messages = get_chat_for_session(session_id)
+    with trace_span("history_load"):
+        messages = get_chat_for_session(session_id)
     record = ChatMessage(session_id=session_id, sender=Sender.USER, message=message)
     messages.append(record)
     try:
-        reply_message = llm_service.chat(messages=messages)
+        trace = current_trace()
+        with trace_span("llm_call"):
+            reply_message = _services().llm_service.chat(
+                messages=messages, record_span=trace.record if trace is not None else None
+            )
     except LLMError as exc:
-        app.logger.error("LLM chat failed for session %s: %s", session_id, exc)
+        current_app.logger.error("LLM chat failed for session %s: %s", session_id, exc)
         # TODO: Decide whether to persist the user message even when the LLM call fails.
         return jsonify({"error": "llm_unavailable", "message": "The language model is unavailable."}), 502
 
     try:
-        db.session.add(record)
-        db.session.add(reply_message)
-        db.session.commit()
+        with trace_span("commit"):
+            db.session.add(record)
+            db.session.add(reply_message)
+            db.session.commit()
     except SQLAlchemyError as exc:
         db.session.rollback()
         return jsonify({"error": "failed to store message", "details": str(exc)}), 500
@@ -169,7 +498,7 @@ def send_chat_message():
     return jsonify(response)
 
 
-@app.get("/api/chat/<session_id>")
+@api.get("/api/chat/<session_id>")
 def get_chat_history(session_id):
     messages = get_chat_for_session(session_id)
     if not messages:
@@ -178,7 +507,72 @@ def get_chat_history(session_id):
     return jsonify({"session_id": session_id, "messages": serialized})
 
 
-@app.get("/api/config/llm")
+@api.post("/api/chat/batch")
+def create_chat_batch():
+    job_id = uuid.uuid4().hex
+    try:
+        total = spool_batch_input(request.stream, input_path(current_app.config["LOCKNO_BATCH_DIR"], job_id))
+    except BatchJobError as exc:
+        return jsonify({"error": str(exc)}), exc.status_code
+
+    job = BatchJob(id=job_id, total=total)
+    try:
+        db.session.add(job)
+        db.session.commit()
+    except SQLAlchemyError as exc:
+        db.session.rollback()
+        current_app.logger.error("Failed to create batch job: %s", exc)
+        return jsonify({"error": "failed to create batch job"}), 500
+
+    _services().batch_runner.submit(job_id)
+    return jsonify(job.to_dict()), 202
+
+
+@api.get("/api/chat/batch/<job_id>")
+def get_chat_batch(job_id: str):
+    job = db.session.get(BatchJob, job_id)
+    if job is None:
+        return jsonify({"error": "batch job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@api.post("/api/chat/batch/<job_id>/cancel")
+def cancel_chat_batch(job_id: str):
+    job = db.session.get(BatchJob, job_id)
+    if job is None:
+        return jsonify({"error": "batch job not found"}), 404
+    if job.is_finished:
+        return jsonify({"error": "batch job already finished", "status": job.status.value}), 409
+
+    try:
+        job.cancel_requested = True
+        db.session.commit()
+    except SQLAlchemyError as exc:
+        db.session.rollback()
+        current_app.logger.error("Failed to cancel batch job %s: %s", job_id, exc)
+        return jsonify({"error": "failed to cancel batch job"}), 500
+
+    _services().batch_runner.cancel(job_id)
+    return jsonify(job.to_dict()), 202
+
+
+@api.get("/api/chat/batch/<job_id>/results")
+def download_chat_batch_results(job_id: str):
+    job = db.session.get(BatchJob, job_id)
+    if job is None:
+        return jsonify({"error": "batch job not found"}), 404
+    path = results_path(current_app.config["LOCKNO_BATCH_DIR"], job_id)
+    if not os.path.exists(path):
+        return jsonify({"error": "no results yet", "status": job.status.value}), 404
+    return send_file(
+        path,
+        mimetype="application/x-ndjson",
+        as_attachment=True,
+        download_name=f"{job_id}.results.ndjson",
+    )
+
+
+@api.get("/api/config/llm")
 def get_llm_config():
     entries = AppConfig.query.order_by(AppConfig.provider.asc()).all()
     if not entries:
@@ -186,7 +580,7 @@ def get_llm_config():
     return jsonify([entry.to_dict() for entry in entries])
 
 
-@app.post("/api/config/llm")
+@api.post("/api/config/llm")
 def set_llm_config():
     body = request.get_json(silent=True) or {}
     if not isinstance(body, dict):
@@ -203,21 +597,36 @@ def set_llm_config():
             400,
         )
 
+    llm_config = _services().config_watcher.current()
     try:
         _, provider_embedding = llm_config.provider_defaults(provider)
     except KeyError:
         provider_embedding = model_name
 
     try:
-        new_adapter = create_adapter(provider=provider, model_name=model_name, embedding_model=provider_embedding)
+        new_adapter = create_adapter(
+            llm_config,
+            current_app.config["OLLAMA_BASE_URL"],
+            provider=provider,
+            model_name=model_name,
+            embedding_model=provider_embedding,
+        )
     except RuntimeError as exc:
         return jsonify({"error": str(exc)}), 400
 
-    llm_service.set_adapter(new_adapter)
-    return jsonify({"provider": provider, "model_name": model_name})
+    try:
+        active = publish_active_model(provider, model_name, provider_embedding)
+        db.session.commit()
+    except SQLAlchemyError as exc:
+        db.session.rollback()
+        current_app.logger.error("Failed to store active model: %s", exc)
+        return jsonify({"error": "failed to store active model"}), 500
+
+    _services().active_model.adopt(active, new_adapter)
+    return jsonify({"provider": provider, "model_name": model_name, "version": active.version})
 
 
-@app.post("/api/documents")
+@api.post("/api/documents")
 def create_document():
     try:
         upload = extract_upload_from_request(request.files.get("file"))
@@ -226,40 +635,247 @@ def create_document():
         return jsonify({"error": str(exc)}), exc.status_code
 
     document = Document(**document_payload)
+    policy = current_app.config["LOCKNO_NEAR_DUPLICATE_POLICY"]
+    if policy != POLICY_OFF:
+        signature = document_signature(
+            document_payload["storage_data"], document_payload["mime_type"], document_payload["filename"]
+        )
+        try:
+            match = find_near_duplicate(
+                signature, document_payload["checksum"], current_app.config["LOCKNO_NEAR_DUPLICATE_THRESHOLD"]
+            )
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            current_app.logger.warning("Near-duplicate lookup failed: %s", exc)
+            match = None
+        if match is not None:
+            original_id, similarity = match
+            if policy == POLICY_REJECT:
+                return (
+                    jsonify({"error": "near-duplicate document", "near_duplicate_of": original_id, "similarity": similarity}),
+                    409,
+                )
+            document.near_duplicate_of_id = original_id
+            document.duplicate_similarity = similarity
+            document.duplicate_status = STATUS_LINKED if policy == POLICY_LINK else STATUS_FLAGGED
+        if signature is not None:
+            document.minhash = signature_to_bytes(signature)
+            # linked copies stay out of the index so matches resolve to the original
+            if document.duplicate_status != STATUS_LINKED:
+                index_signature(document, signature)
+
     try:
         db.session.add(document)
+        bump_index_generation()
         db.session.commit()
     except SQLAlchemyError as exc:
         db.session.rollback()
-        app.logger.error("Failed to store document: %s", exc)
+        current_app.logger.error("Failed to store document: %s", exc)
         return jsonify({"error": "failed to store document"}), 500
 
     return jsonify(document.to_dict()), 201
 
 
-@app.get("/api/documents")
+@api.get("/api/documents")
 def list_documents():
     documents = Document.query.order_by(Document.created_at.desc()).all()
     return jsonify([doc.to_dict() for doc in documents])
 
 
-@app.delete("/api/documents/<int:document_id>")
+@api.delete("/api/documents/<int:document_id>")
 def delete_document(document_id: int):
     document = Document.query.get(document_id)
     if document is None:
         return jsonify({"error": "document not found"}), 404
 
+    checksum = document.checksum
     try:
+        release_duplicates(document_id)
         db.session.delete(document)
+        bump_index_generation()
         db.session.commit()
     except SQLAlchemyError as exc:
         db.session.rollback()
-        app.logger.error("Failed to delete document %s: %s", document_id, exc)
+        current_app.logger.error("Failed to delete document %s: %s", document_id, exc)
         return jsonify({"error": "failed to delete document"}), 500
 
+    try:
+        evict_cached_document(current_app.config["LOCKNO_DOCUMENT_CACHE_DIR"], checksum)
+    except (OSError, SQLAlchemyError) as exc:
+        current_app.logger.warning("Failed to evict cached document %s: %s", document_id, exc)
     return jsonify({"status": "deleted", "id": document_id})
 
 
+@api.get("/api/documents/<int:document_id>/content")
+def get_document_content(document_id: int):
+    document = db.session.get(Document, document_id)
+    if document is None:
+        return jsonify({"error": "document not found"}), 404
+    as_attachment = request.args.get("download", "").lower() in ("1", "true", "yes")
+
+    cache_dir = current_app.config["LOCKNO_DOCUMENT_CACHE_DIR"]
+    if cache_dir:
+        try:
+            max_bytes = int(current_app.config["LOCKNO_DOCUMENT_CACHE_MB"] * 1024 * 1024)
+            path = cached_document_path(cache_dir, document, max_bytes)
+        except OSError as exc:
+            current_app.logger.warning("Failed to cache document %s: %s", document_id, exc)
+            path = None
+        if path is not None:
+            # a real file lets the WSGI server use sendfile and Werkzeug handle ranges
+            return send_file(
+                path,
+                mimetype=document.mime_type,
+                as_attachment=as_attachment,
+                download_name=document.filename,
+                conditional=True,
+                etag=document.checksum,
+                last_modified=document.created_at,
+                max_age=DOCUMENT_MAX_AGE_SECONDS,
+            )
+
+    return _stream_document(document, as_attachment)
+
+
+@api.get("/api/documents/<int:document_id>/chunks")
+def get_document_chunks(document_id: int):
+    document = db.session.get(Document, document_id)
+    if document is None:
+        return jsonify({"error": "document not found"}), 404
+    try:
+        max_tokens = int(request.args.get("max_tokens", current_app.config["LOCKNO_CHUNK_TOKENS"]))
+        overlap = int(request.args.get("overlap", current_app.config["LOCKNO_CHUNK_OVERLAP_TOKENS"]))
+    except ValueError:
+        return jsonify({"error": "max_tokens and overlap must be integers"}), 400
+
+    chunks = iter_document_chunks(document.storage_data, document.mime_type, document.filename, max_tokens, overlap)
+    try:
+        # pull the first chunk eagerly so bad parameters and unreadable files get a proper status
+        first = next(chunks, None)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except TextExtractionError as exc:
+        return jsonify({"error": str(exc)}), 422
+
+    head = () if first is None else (first,)
+    return current_app.response_class(_chunk_lines(chain(head, chunks)), mimetype="application/x-ndjson")
+
+
+def _chunk_lines(chunks: Iterable[Chunk]) -> Iterator[str]:
+    try:
+        for chunk in chunks:
+            yield json.dumps(asdict(chunk)) + "\n"
+    except TextExtractionError as exc:
+        # the status line has already been sent; end the stream with an error record instead
+        yield json.dumps({"error": str(exc)}) + "\n"
+
+
+@api.get("/api/metrics/retrieval-cache")
+def get_retrieval_cache_metrics():
+    cache = _services().retrieval_cache
+    try:
+        index_generation = current_index_generation()
+    except SQLAlchemyError as exc:
+        db.session.rollback()
+        current_app.logger.warning("Failed to read document index generation: %s", exc)
+        index_generation = None
+    return jsonify({**cache.stats(), "enabled": cache.enabled, "pid": os.getpid(), "index_generation": index_generation})
+
+
+@api.get("/api/export")
+def export_data():
+    include = {part.strip() for part in request.args.get("include", "messages,documents").split(",") if part.strip()}
+    if not include or include - {"messages", "documents"}:
+        return jsonify({"error": "include must list messages and/or documents"}), 400
+    lines = iter_export("messages" in include, "documents" in include, request.args.get("session_id"))
+    response = current_app.response_class(stream_with_context(lines), mimetype="application/x-ndjson")
+    response.headers["Content-Disposition"] = _content_disposition("lockno-export.ndjson", as_attachment=True)
+    return response
+
+
+@api.post("/api/import")
+def import_data():
+    try:
+        skip_messages = int(request.args.get("skip_messages", 0))
+        skip_documents = int(request.args.get("skip_documents", 0))
+    except ValueError:
+        return jsonify({"error": "skip_messages and skip_documents must be integers"}), 400
+    try:
+        counts = import_records(request.stream, skip_messages=skip_messages, skip_documents=skip_documents)
+    except DataTransferError as exc:
+        resume = {
+            "skip_messages": skip_messages + exc.imported["messages"],
+            "skip_documents": skip_documents + exc.imported["documents"],
+        }
+        return jsonify({"error": str(exc), "imported": exc.imported, "resume": resume}), exc.status_code
+    except SQLAlchemyError as exc:
+        current_app.logger.error("Import failed: %s", exc)
+        return jsonify({"error": "failed to import data"}), 500
+    return jsonify({"imported": counts})
+
+
+def _stream_document(document: Document, as_attachment: bool):
+    """Serve a document straight from the database, honouring Range and conditional headers."""
+    response = current_app.response_class(mimetype=document.mime_type)
+    if document.checksum:
+        response.set_etag(document.checksum)
+    response.last_modified = document.created_at
+    response.cache_control.public = False
+    response.cache_control.max_age = DOCUMENT_MAX_AGE_SECONDS
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Content-Disposition"] = _content_disposition(document.filename, as_attachment)
+    response.make_conditional(request)
+    if response.status_code in (304, 412):
+        return response
+
+    size = document.size_bytes
+    start, stop = 0, size
+    if "Range" in request.headers and _if_range_matches(document):
+        byte_range = request.range
+        if byte_range is None:
+            return _range_not_satisfiable(size)
+        # multi-range requests are answered with the whole body
+        if len(byte_range.ranges) == 1:
+            bounds = byte_range.range_for_length(size)
+            if bounds is None:
+                return _range_not_satisfiable(size)
+            start, stop = bounds
+            response.status_code = 206
+            response.content_range = byte_range.to_content_range_header(size)
+
+    response.response = stream_with_context(iter_document_bytes(document, start, stop - 1))
+    response.direct_passthrough = True
+    response.content_length = stop - start
+    return response
+
+
+def _if_range_matches(document: Document) -> bool:
+    if "If-Range" not in request.headers:
+        return True
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == document.checksum
+    if if_range.date is None or document.created_at is None:
+        return False
+    created_at = document.created_at
+    if created_at.tzinfo is None:  # SQLite drops the offset
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.replace(microsecond=0) <= if_range.date
+
+
+def _range_not_satisfiable(size: int):
+    response = jsonify({"error": "requested range not satisfiable"})
+    response.status_code = 416
+    response.headers["Content-Range"] = f"bytes */{size}"
+    return response
+
+
+def _content_disposition(filename: str, as_attachment: bool) -> str:
+    kind = "attachment" if as_attachment else "inline"
+    fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii").replace('"', "").replace("\\", "") or "document"
+    return f"{kind}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
 def get_chat_for_session(session_id: str) -> list[ChatMessage]:
     return (
         ChatMessage.query.filter_by(session_id=session_id)
@@ -276,13 +892,11 @@ def _model_supported(provider: str, model_name: str) -> bool:
         is not None
     )
 
-with app.app_context():
-    ensure_config_seeded()
 
-@app.route("/")
+@api.route("/")
 def index():
     return "Flask setup works"
 
 
 if __name__ == "__main__":
-    app.run()
+    create_app().run()
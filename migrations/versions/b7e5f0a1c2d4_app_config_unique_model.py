@@ -0,0 +1,32 @@
+"""App config unique model
+
+Revision ID: b7e5f0a1c2d4
+Revises: 8c41d2e7a9b3
+Create Date: 2026-10-18 14:03:11.274519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e5f0a1c2d4'
+down_revision = '8c41d2e7a9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # drop duplicates left behind by the old delete-and-reinsert seeding
+    op.execute(
+        "DELETE FROM app_config WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM app_config "
+        "GROUP BY provider, model_name, model_type) AS keep)"
+    )
+    with op.batch_alter_table('app_config', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_app_config_model', ['provider', 'model_name', 'model_type'])
+
+
+def downgrade():
+    with op.batch_alter_table('app_config', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_app_config_model', type_='unique')
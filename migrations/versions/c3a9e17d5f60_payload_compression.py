@@ -0,0 +1,37 @@
+"""Payload compression
+
+Revision ID: c3a9e17d5f60
+Revises: b7e5f0a1c2d4
+Create Date: 2026-10-18 16:41:27.903118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a9e17d5f60'
+down_revision = 'b7e5f0a1c2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('message_data', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('message_codec', sa.String(length=16), server_default='none', nullable=False))
+        batch_op.alter_column('message', existing_type=sa.Text(), nullable=True)
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_codec', sa.String(length=16), server_default='none', nullable=False))
+
+
+def downgrade():
+    # run `flask --app main compress-payloads --codec none` first so every row is stored uncompressed
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_column('storage_codec')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.alter_column('message', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('message_codec')
+        batch_op.drop_column('message_data')
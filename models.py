@@ -3,10 +3,12 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Dict, Any
+from typing import Any, Dict, Optional
 
 from flask_sqlalchemy import SQLAlchemy
 
+from compression import CODEC_NONE, decompress, encode
+
 
 db = SQLAlchemy()
 
@@ -17,6 +19,14 @@ class Sender(str, Enum):
     SYSTEM = "system"
 
 
+class BatchStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
@@ -30,9 +40,30 @@ class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     session_id = db.Column(db.String(36), index=True, nullable=False)
     sender = db.Column(db.Enum(Sender), nullable=False)
-    message = db.Column(db.Text, nullable=False)
+    # uncompressed rows keep using the text column; compressed ones store bytes in message_data
+    message_text = db.Column("message", db.Text, nullable=True)
+    message_data = db.Column(db.LargeBinary, nullable=True)
+    message_codec = db.Column(db.String(16), nullable=False, default=CODEC_NONE, server_default=CODEC_NONE)
     timestamp = db.Column(db.DateTime(timezone=True), nullable=False, default=_utcnow)
 
+    @property
+    def message(self) -> str:
+        if self.message_codec and self.message_codec != CODEC_NONE:
+            return decompress(self.message_data, self.message_codec).decode("utf-8")
+        return self.message_text or ""
+
+    @message.setter
+    def message(self, value: str) -> None:
+        self.set_message(value)
+
+    def set_message(self, value: str, codec: Optional[str] = None) -> None:
+        stored, codec = encode(value.encode("utf-8"), codec)
+        if codec == CODEC_NONE:
+            self.message_text, self.message_data = value, None
+        else:
+            self.message_text, self.message_data = None, stored
+        self.message_codec = codec
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.id,
@@ -45,6 +76,9 @@ class ChatMessage(db.Model):
 
 class AppConfig(db.Model):
     __tablename__ = "app_config"
+    __table_args__ = (
+        db.UniqueConstraint("provider", "model_name", "model_type", name="uq_app_config_model"),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     provider = db.Column(db.String(64), nullable=False)
@@ -60,6 +94,38 @@ class AppConfig(db.Model):
         }
 
 
+class ActiveModel(db.Model):
+    """Single-row table holding the model every worker process should serve."""
+
+    __tablename__ = "active_model"
+
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(64), nullable=False)
+    model_name = db.Column(db.String(128), nullable=False)
+    embedding_model = db.Column(db.String(128), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=_utcnow, onupdate=_utcnow)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model_name": self.model_name,
+            "embedding_model": self.embedding_model,
+            "version": self.version,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class DocumentIndexState(db.Model):
+    """Single-row table whose generation goes up whenever the document set changes."""
+
+    __tablename__ = "document_index_state"
+
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=_utcnow, onupdate=_utcnow)
+
+
 class Document(db.Model):
     __tablename__ = "documents"
 
@@ -68,8 +134,28 @@ class Document(db.Model):
     mime_type = db.Column(db.String(128), nullable=False)
     size_bytes = db.Column(db.Integer, nullable=False)
     checksum = db.Column(db.String(128), nullable=True)
-    storage_data = db.Column(db.LargeBinary, nullable=False)
+    # deferred so listing/metadata queries never pull the blob
+    stored_data = db.deferred(db.Column("storage_data", db.LargeBinary, nullable=False))
+    storage_codec = db.Column(db.String(16), nullable=False, default=CODEC_NONE, server_default=CODEC_NONE)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=_utcnow)
+    minhash = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    near_duplicate_of_id = db.Column(db.Integer, db.ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+    duplicate_similarity = db.Column(db.Float, nullable=True)
+    # "flagged": stored and processed as usual; "linked": reuses the original's downstream data
+    duplicate_status = db.Column(db.String(16), nullable=True)
+
+    lsh_bands = db.relationship("DocumentLSHBand", cascade="all, delete-orphan", lazy="select")
+
+    @property
+    def storage_data(self) -> bytes:
+        return decompress(self.stored_data, self.storage_codec)
+
+    @storage_data.setter
+    def storage_data(self, value: bytes) -> None:
+        self.set_storage_data(value)
+
+    def set_storage_data(self, value: bytes, codec: Optional[str] = None) -> None:
+        self.stored_data, self.storage_codec = encode(value, codec)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -79,4 +165,52 @@ class Document(db.Model):
             "size_bytes": self.size_bytes,
             "checksum": self.checksum,
             "created_at": self.created_at.isoformat() if self.created_at else None,
+            "near_duplicate_of": self.near_duplicate_of_id,
+            "duplicate_similarity": self.duplicate_similarity,
+            "duplicate_status": self.duplicate_status,
+        }
+
+
+class DocumentLSHBand(db.Model):
+    """One LSH bucket a document's MinHash signature falls into."""
+
+    __tablename__ = "document_lsh_bands"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    document_id = db.Column(db.Integer, db.ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    band_key = db.Column(db.String(40), nullable=False, index=True)
+
+
+class BatchJob(db.Model):
+    __tablename__ = "batch_jobs"
+
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.Enum(BatchStatus), nullable=False, default=BatchStatus.PENDING)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=_utcnow)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    # lease held by the dispatcher running the job; renewed at every progress flush
+    owner = db.Column(db.String(64), nullable=True)
+    heartbeat_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (BatchStatus.COMPLETED, BatchStatus.CANCELLED, BatchStatus.FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancel_requested": self.cancel_requested,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "heartbeat_at": self.heartbeat_at.isoformat() if self.heartbeat_at else None,
         }
@@ -0,0 +1,207 @@
+"""Opt-in per-request span tracing and cProfile capture."""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+from flask import Flask, Response, g, request
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODE_SPANS = "spans"
+PROFILE_MODE_CPROFILE = "cprofile"
+CPROFILE_TOP_N = 30
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("lockno_request_trace", default=None)
+_NOOP_SPAN = nullcontext()
+
+
+class RequestTrace:
+    """Collects named span timings (and optionally a cProfile) for one request."""
+
+    def __init__(self, method: str, path: str, use_cprofile: bool = False):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self._origin = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.profiler: Optional[cProfile.Profile] = None
+        if use_cprofile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler already owns the interpreter
+                logger.warning("cProfile unavailable for request %s", self.id)
+            else:
+                self.profiler = profiler
+
+    def record(self, name: str, start: float, end: float) -> None:
+        """Store a span from two ``time.perf_counter`` readings."""
+
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self._origin) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        })
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def finish(self, status_code: int) -> Dict[str, Any]:
+        total_ms = round((time.perf_counter() - self._origin) * 1000, 3)
+        report: Dict[str, Any] = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status_code,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": total_ms,
+            "spans": self.spans,
+        }
+        if self.profiler is not None:
+            self.profiler.disable()
+            summary = io.StringIO()
+            pstats.Stats(self.profiler, stream=summary).sort_stats("cumulative").print_stats(CPROFILE_TOP_N)
+            report["cprofile"] = summary.getvalue()
+        return report
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{span['name']};dur={span['duration_ms']}" for span in self.spans)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def trace_span(name: str) -> ContextManager[None]:
+    """Time a block against the active request trace; a shared no-op otherwise."""
+
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return trace.span(name)
+
+
+def write_report(
+    report_dir: str, report: Dict[str, Any], profiler: Optional[cProfile.Profile], max_reports: int = 0
+) -> None:
+    """Write ``report`` (and its ``.prof``), then drop the oldest beyond ``max_reports`` (0 keeps all)."""
+
+    os.makedirs(report_dir, exist_ok=True)
+    stem = os.path.join(report_dir, f"{report['started_at'][:19].replace(':', '')}-{report['id']}")
+    with open(f"{stem}.json", "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+    if profiler is not None:
+        profiler.dump_stats(f"{stem}.prof")
+    if max_reports > 0:
+        _prune_reports(report_dir, max_reports)
+
+
+def _prune_reports(report_dir: str, keep: int) -> None:
+    # report names start with their timestamp, so name order is age order
+    stems = sorted(name[:-5] for name in os.listdir(report_dir) if name.endswith(".json"))
+    for stem in stems[:max(0, len(stems) - keep)]:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(report_dir, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def _requested_mode(value: str, token: str) -> str:
+    """Return the profile mode asked for by ``<token>[;cprofile]``, or "" if the token does not match."""
+
+    supplied, _, mode = value.partition(";")
+    if not token or not hmac.compare_digest(supplied.strip().encode(), token.encode()):
+        return ""
+    return mode.strip().lower() or PROFILE_MODE_SPANS
+
+
+def init_profiling(app: Flask) -> None:
+    """Register request hooks that start/finish traces.
+
+    A request is traced when its ``LOCKNO_PROFILE_HEADER`` header carries
+    ``LOCKNO_PROFILE_TOKEN`` (``<token>`` for span timings, ``<token>;cprofile``
+    to add a cProfile) or it is picked by ``LOCKNO_PROFILE_SAMPLE_RATE``. The
+    header is ignored while no token is configured, since reports expose
+    server paths. Traced responses get a ``Server-Timing`` header;
+    header-requested JSON object responses also get the report under
+    ``debug.profile``. Reports are written to ``LOCKNO_PROFILE_DIR`` when it
+    is set, keeping the newest ``LOCKNO_PROFILE_MAX_REPORTS``.
+    """
+
+    token = app.config.get("LOCKNO_PROFILE_TOKEN", "")
+    header = app.config.get("LOCKNO_PROFILE_HEADER", "") if token else ""
+    sample_rate = float(app.config.get("LOCKNO_PROFILE_SAMPLE_RATE", 0.0))
+    report_dir = app.config.get("LOCKNO_PROFILE_DIR", "")
+    max_reports = int(app.config.get("LOCKNO_PROFILE_MAX_REPORTS", 0))
+    if not header and sample_rate <= 0:
+        return
+
+    @app.before_request
+    def _start_trace() -> None:
+        requested = _requested_mode(request.headers.get(header, ""), token) if header else ""
+        if not requested:
+            if sample_rate <= 0 or random.random() >= sample_rate:
+                return
+        trace = RequestTrace(request.method, request.path, use_cprofile=requested == PROFILE_MODE_CPROFILE)
+        g.lockno_trace_token = _current_trace.set(trace)
+        g.lockno_trace_requested = bool(requested)
+
+    @app.after_request
+    def _finish_trace(response: Response) -> Response:
+        trace = _current_trace.get()
+        if trace is None:
+            return response
+        report = trace.finish(response.status_code)
+        response.headers["Server-Timing"] = trace.server_timing()
+        if report_dir:
+            try:
+                write_report(report_dir, report, trace.profiler, max_reports)
+            except OSError as exc:
+                logger.warning("Failed to write profile report %s: %s", trace.id, exc)
+        if g.get("lockno_trace_requested") and response.is_json:
+            body = response.get_json(silent=True)
+            if isinstance(body, dict):
+                body["debug"] = {"profile": report}
+                response.set_data(json.dumps(body))
+        return response
+
+    @app.teardown_request
+    def _clear_trace(exc: Optional[BaseException] = None) -> None:
+        token = g.pop("lockno_trace_token", None)
+        if token is not None:
+            trace = _current_trace.get()
+            if trace is not None and trace.profiler is not None:
+                trace.profiler.disable()
+            _current_trace.reset(token)
+
+
+__all__ = [
+    "PROFILE_MODE_CPROFILE",
+    "PROFILE_MODE_SPANS",
+    "RequestTrace",
+    "current_trace",
+    "init_profiling",
+    "trace_span",
+    "write_report",
+]
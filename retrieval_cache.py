@@ -0,0 +1,172 @@
+"""Versioned cache for retrieval results, invalidated by the document-index generation."""
+from __future__ import annotations
+
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import DocumentIndexState, db
+
+
+INDEX_STATE_ROW_ID = 1
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+CacheKey = Tuple[str, str, int, int]
+
+
+def bump_index_generation() -> None:
+    """Advance the shared document-index generation.
+
+    Call it in the same transaction as the document change; the caller owns
+    the transaction and must commit.
+    """
+
+    bump = (
+        update(DocumentIndexState)
+        .where(DocumentIndexState.id == INDEX_STATE_ROW_ID)
+        .values(generation=DocumentIndexState.generation + 1)
+    )
+    if db.session.execute(bump).rowcount == 0:
+        try:
+            with db.session.begin_nested():
+                db.session.add(DocumentIndexState(id=INDEX_STATE_ROW_ID, generation=1))
+        except IntegrityError:
+            # another worker created the row first
+            db.session.execute(bump)
+
+
+def current_index_generation() -> int:
+    generation = db.session.execute(
+        select(DocumentIndexState.generation).where(DocumentIndexState.id == INDEX_STATE_ROW_ID)
+    ).scalar()
+    return generation or 0
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, Unicode compatibility forms and whitespace so trivially different repeats share a key."""
+
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", query).casefold()).strip()
+
+
+def _result_size(results: Any) -> int:
+    return len(json.dumps(results, default=str))
+
+
+class RetrievalCache:
+    """Thread-safe LRU of retrieval results, bounded by entry count and size.
+
+    Keys include the document-index generation, so entries computed before a
+    document was added or removed can never be served again. The first lookup
+    that sees a newer generation drops all older entries at once. Cached
+    results are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, query: str, embedding_model: str, generation: int, top_k: int) -> Any | None:
+        key = (normalize_query(query), embedding_model, generation, top_k)
+        with self._lock:
+            self._advance(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, embedding_model: str, generation: int, top_k: int, results: Any) -> None:
+        if not self.enabled:
+            return
+        key = (normalize_query(query), embedding_model, generation, top_k)
+        size = _result_size(results)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._advance(generation)
+            if generation < self._generation:
+                return  # computed against an index that has already changed
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (results, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(
+        self,
+        query: str,
+        embedding_model: str,
+        generation: int,
+        top_k: int,
+        compute: Callable[[], Any],
+    ) -> Any:
+        """Return cached results, or run ``compute`` (outside the lock) and cache them."""
+
+        results = self.get(query, embedding_model, generation, top_k)
+        if results is None:
+            results = compute()
+            self.put(query, embedding_model, generation, top_k, results)
+        return results
+
+    def _advance(self, generation: int) -> None:
+        if generation <= self._generation:
+            return
+        self._generation = generation
+        stale = [key for key in self._entries if key[2] < generation]
+        for key in stale:
+            self._bytes -= self._entries.pop(key)[1]
+        self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+__all__ = [
+    "DEFAULT_MAX_BYTES",
+    "DEFAULT_MAX_ENTRIES",
+    "INDEX_STATE_ROW_ID",
+    "RetrievalCache",
+    "bump_index_generation",
+    "current_index_generation",
+    "normalize_query",
+]
@@ -0,0 +1,131 @@
+"""Plain-text extraction for the document formats accepted on upload."""
+from __future__ import annotations
+
+import codecs
+import io
+import os
+import zipfile
+import zlib
+from typing import IO, Iterator
+from xml.etree.ElementTree import ParseError, iterparse
+
+
+TEXT_DECODE_CHUNK_SIZE = 64 * 1024
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# what zipfile/zlib/expat raise on damaged or unsupported archives
+_DOCX_ERRORS = (zipfile.BadZipFile, KeyError, ParseError, zlib.error, EOFError, NotImplementedError, RuntimeError, ValueError)
+
+
+class TextExtractionError(Exception):
+    """Raised when a document's text cannot be extracted."""
+
+
+def _document_kind(mime_type: str, filename: str) -> str:
+    _, ext = os.path.splitext((filename or "").lower())
+    if ext == ".pdf" or mime_type == "application/pdf":
+        return "pdf"
+    if ext == ".docx" or mime_type == DOCX_MIME_TYPE:
+        return "docx"
+    return "text"
+
+
+def iter_document_text(data: bytes, mime_type: str, filename: str) -> Iterator[str]:
+    """Yield a document's text in pieces (decoded chunks, paragraphs or pages).
+
+    Pieces are yielded in document order; joining them with ``""`` gives the
+    full text. Paragraph/page pieces end with a newline so block boundaries
+    survive the join.
+    """
+
+    kind = _document_kind((mime_type or "").lower(), filename)
+    if kind == "pdf":
+        return _iter_pdf_text(data)
+    if kind == "docx":
+        return _iter_docx_text(data)
+    return _iter_plain_text(data)
+
+
+def extract_text(data: bytes, mime_type: str, filename: str) -> str:
+    return "".join(iter_document_text(data, mime_type, filename))
+
+
+def _iter_plain_text(data: bytes) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    for offset in range(0, len(data), TEXT_DECODE_CHUNK_SIZE):
+        text = decoder.decode(data[offset:offset + TEXT_DECODE_CHUNK_SIZE])
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _iter_docx_text(data: bytes) -> Iterator[str]:
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        body = archive.open("word/document.xml")
+    except _DOCX_ERRORS as exc:
+        raise TextExtractionError("not a valid .docx file") from exc
+    with archive, body:
+        try:
+            yield from _iter_docx_paragraphs(body)
+        except _DOCX_ERRORS as exc:
+            raise TextExtractionError(f"not a valid .docx file: {exc}") from exc
+
+
+def _iter_docx_paragraphs(body: IO[bytes]) -> Iterator[str]:
+    """Yield paragraph text; a paragraph longer than ``TEXT_DECODE_CHUNK_SIZE`` comes in slices.
+
+    Finished elements are detached from their parent, so memory stays bounded
+    by the nesting depth however far the XML expands.
+    """
+
+    parts = []
+    size = 0
+    open_elements = []
+    for event, element in iterparse(body, events=("start", "end")):
+        if event == "start":
+            open_elements.append(element)
+            continue
+        open_elements.pop()
+        tag = element.tag
+        if tag == f"{_WORD_NS}t" and element.text:
+            parts.append(element.text)
+            size += len(element.text)
+        elif tag == f"{_WORD_NS}tab":
+            parts.append("\t")
+        elif tag in (f"{_WORD_NS}br", f"{_WORD_NS}cr"):
+            parts.append("\n")
+        if open_elements:
+            open_elements[-1].remove(element)
+        if tag == f"{_WORD_NS}p":
+            yield "".join(parts) + "\n"
+            parts, size = [], 0
+        elif size >= TEXT_DECODE_CHUNK_SIZE:
+            yield "".join(parts)
+            parts, size = [], 0
+
+
+def _iter_pdf_text(data: bytes) -> Iterator[str]:
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError as exc:
+        raise TextExtractionError("PDF text extraction requires the 'pypdf' package") from exc
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        for page in reader.pages:
+            yield (page.extract_text() or "") + "\n"
+    except PdfReadError as exc:
+        raise TextExtractionError("not a valid PDF file") from exc
+    except Exception as exc:
+        # pypdf raises a wide range of builtin errors on malformed input
+        raise TextExtractionError(f"unreadable PDF file: {exc}") from exc
+
+
+__all__ = [
+    "TextExtractionError",
+    "extract_text",
+    "iter_document_text",
+]